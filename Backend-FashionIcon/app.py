@@ -1,12 +1,28 @@
+import asyncio
+import bisect
+import hashlib
+import json
 import os
+import re
+import secrets
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+from pydantic import BaseModel, Field
+import httpx
 import openai 
-import requests 
-import uuid 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+from urllib.parse import parse_qs
 
 # Load environment variables from .env file
 load_dotenv() 
@@ -14,18 +30,403 @@ load_dotenv()
 # --- API Key Setup ---
 api_key = os.getenv("OPENAI_API_KEY") 
 MEMMACHINE_API_BASE = os.getenv("MEMMACHINE_API_BASE", "http://0.0.0.0:8080") 
+# Comma-separated MemMachine nodes; users are spread across them by consistent hashing
+MEMMACHINE_NODES = [url.strip() for url in os.getenv("MEMMACHINE_NODES", MEMMACHINE_API_BASE).split(",") if url.strip()]
+# Virtual points per node on the hash ring
+MEMMACHINE_RING_REPLICAS = int(os.getenv("MEMMACHINE_RING_REPLICAS", "100"))
+
+# --- Outfit Model Setup ---
+OUTFIT_MODEL = os.getenv("OUTFIT_MODEL", "gpt-4o-mini-2024-07-18")
+OUTFIT_TEMPERATURE = float(os.getenv("OUTFIT_TEMPERATURE", "0.8"))
+OUTFIT_MAX_TOKENS = int(os.getenv("OUTFIT_MAX_TOKENS", "300"))
+
+# --- Alternates Pool Setup ---
+# Candidates requested per completion (`n`). Every candidate is billed, so extras are opt-in;
+# they seed the cache's variants and the pool served by "regenerate"
+OUTFIT_CANDIDATES = int(os.getenv("OUTFIT_CANDIDATES", "1"))
+OUTFIT_ALTERNATES_TTL_SECONDS = float(os.getenv("OUTFIT_ALTERNATES_TTL_SECONDS", "1800"))
+OUTFIT_ALTERNATES_MAX_KEYS = int(os.getenv("OUTFIT_ALTERNATES_MAX_KEYS", "1024"))
+
+# --- Outfit Catalog Setup ---
+OUTFIT_CATALOG_PATH = os.getenv(
+    "OUTFIT_CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.json")
+)
+# Serve a catalog draft instead of failing when generation hits a transient error (429, 5xx, connection),
+# is shed, or takes longer than the timeout. Errors a retry cannot fix, like a bad API key, still fail
+OUTFIT_CATALOG_FALLBACK = os.getenv("OUTFIT_CATALOG_FALLBACK", "true").lower() == "true"
+# 0 disables the timeout; a generation that outlives it still lands in the cache for the next request
+OUTFIT_FALLBACK_TIMEOUT_SECONDS = float(os.getenv("OUTFIT_FALLBACK_TIMEOUT_SECONDS", "20"))
+
+# --- Batch Generation Setup ---
+OUTFIT_BATCH_MAX_ITEMS = int(os.getenv("OUTFIT_BATCH_MAX_ITEMS", "14"))
+OUTFIT_BATCH_CONCURRENCY = int(os.getenv("OUTFIT_BATCH_CONCURRENCY", "4"))
+
+# --- OpenAI Scheduler Setup ---
+# Keep these a little under the account's limits for OUTFIT_MODEL
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+# Requests whose estimated queue wait exceeds this are shed with a 503
+OPENAI_REQUEST_DEADLINE_SECONDS = float(os.getenv("OPENAI_REQUEST_DEADLINE_SECONDS", "10"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_RETRY_BACKOFF_SECONDS = float(os.getenv("OPENAI_RETRY_BACKOFF_SECONDS", "1"))
+
+# --- Connection Pool Setup ---
+# Concurrency is bounded by these pool sizes rather than by the threadpool.
+MEMMACHINE_MAX_CONNECTIONS = int(os.getenv("MEMMACHINE_MAX_CONNECTIONS", "100"))
+MEMMACHINE_MAX_KEEPALIVE = int(os.getenv("MEMMACHINE_MAX_KEEPALIVE", "20"))
+MEMMACHINE_KEEPALIVE_EXPIRY = float(os.getenv("MEMMACHINE_KEEPALIVE_EXPIRY", "30"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+# Long enough for a connection opened by /warmup to survive until the user submits
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "120"))
+
+# --- Background Memory Writer Setup ---
+MEMORY_LOG_QUEUE_SIZE = int(os.getenv("MEMORY_LOG_QUEUE_SIZE", "1000"))
+MEMORY_LOG_BATCH_SIZE = int(os.getenv("MEMORY_LOG_BATCH_SIZE", "20"))
+MEMORY_LOG_CONCURRENCY = int(os.getenv("MEMORY_LOG_CONCURRENCY", "4"))
+MEMORY_LOG_MAX_RETRIES = int(os.getenv("MEMORY_LOG_MAX_RETRIES", "3"))
+MEMORY_LOG_BACKOFF_SECONDS = float(os.getenv("MEMORY_LOG_BACKOFF_SECONDS", "0.5"))
+MEMORY_LOG_FLUSH_TIMEOUT = float(os.getenv("MEMORY_LOG_FLUSH_TIMEOUT", "10"))
+# Per batch request; MemMachine runs profile extraction for every episode in it
+MEMORY_LOG_TIMEOUT_SECONDS = float(os.getenv("MEMORY_LOG_TIMEOUT_SECONDS", "30"))
+
+# --- Outfit Response Cache Setup ---
+OUTFIT_CACHE_SIZE = int(os.getenv("OUTFIT_CACHE_SIZE", "512"))
+OUTFIT_CACHE_TTL_SECONDS = float(os.getenv("OUTFIT_CACHE_TTL_SECONDS", "3600"))
+# Distinct generations kept per key; hits rotate through whichever are stored so far,
+# and later fresh generations for the key (e.g. bypass_cache requests) fill the rest
+OUTFIT_CACHE_VARIANTS = int(os.getenv("OUTFIT_CACHE_VARIANTS", "3"))
+
+# --- Memory Context Builder Setup ---
+MEMORY_SEARCH_LIMIT = int(os.getenv("MEMORY_SEARCH_LIMIT", "5"))
+# Approximate prompt tokens the profile memory block may use
+MEMORY_CONTEXT_TOKEN_BUDGET = int(os.getenv("MEMORY_CONTEXT_TOKEN_BUDGET", "400"))
+# Word-overlap (Jaccard) at or above which two memories count as duplicates
+MEMORY_CONTEXT_DEDUP_THRESHOLD = float(os.getenv("MEMORY_CONTEXT_DEDUP_THRESHOLD", "0.85"))
+
+# --- Memory Context Cache Setup ---
+MEMORY_CONTEXT_TTL_SECONDS = float(os.getenv("MEMORY_CONTEXT_TTL_SECONDS", "300"))
+# How long past its TTL (or after an invalidation) an entry may still be served while it refreshes
+MEMORY_CONTEXT_STALE_SECONDS = float(os.getenv("MEMORY_CONTEXT_STALE_SECONDS", "3600"))
+MEMORY_CONTEXT_MAX_QUERIES_PER_USER = int(os.getenv("MEMORY_CONTEXT_MAX_QUERIES_PER_USER", "64"))
+# On a miss for a new query, serve the user's freshest context (e.g. from /warmup) and fetch the query in the background
+MEMORY_CONTEXT_USER_FALLBACK = os.getenv("MEMORY_CONTEXT_USER_FALLBACK", "true").lower() == "true"
+
+# --- History Cache Setup ---
+HISTORY_QUERY = "Show all outfit recommendations"
+HISTORY_FETCH_LIMIT = int(os.getenv("HISTORY_FETCH_LIMIT", "100"))
+# Safety net for episodes written to MemMachine by something other than this service
+HISTORY_CACHE_TTL_SECONDS = float(os.getenv("HISTORY_CACHE_TTL_SECONDS", "600"))
+
+# --- MemMachine Resilience Setup ---
+# Generation proceeds without memory context once retrieval exceeds this budget
+MEMORY_RETRIEVAL_BUDGET_SECONDS = float(os.getenv("MEMORY_RETRIEVAL_BUDGET_SECONDS", "0.8"))
+MEMMACHINE_SEARCH_TIMEOUT_SECONDS = float(os.getenv("MEMMACHINE_SEARCH_TIMEOUT_SECONDS", "5"))
+MEMMACHINE_PROXY_TIMEOUT_SECONDS = float(os.getenv("MEMMACHINE_PROXY_TIMEOUT_SECONDS", "10"))
+MEMMACHINE_HEDGE_ENABLED = os.getenv("MEMMACHINE_HEDGE_ENABLED", "true").lower() == "true"
+# Hedge after the observed p95, but never sooner than this
+MEMMACHINE_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("MEMMACHINE_HEDGE_MIN_DELAY_SECONDS", "0.25"))
+MEMMACHINE_BREAKER_FAILURE_THRESHOLD = int(os.getenv("MEMMACHINE_BREAKER_FAILURE_THRESHOLD", "5"))
+MEMMACHINE_BREAKER_RESET_SECONDS = float(os.getenv("MEMMACHINE_BREAKER_RESET_SECONDS", "30"))
+
+# --- MemMachine Session Setup ---
+# Sessions are reused per user and rotate when the (epoch-aligned) window ends, i.e. daily by default
+MEMMACHINE_SESSION_ROTATION_SECONDS = int(os.getenv("MEMMACHINE_SESSION_ROTATION_SECONDS", "86400"))
+# Also rotate after this many logged episodes; 0 disables episode-based rotation
+MEMMACHINE_SESSION_MAX_EPISODES = int(os.getenv("MEMMACHINE_SESSION_MAX_EPISODES", "0"))
+
+# --- Tracing Setup ---
+# Finished spans are appended here as OTLP/JSON lines, one export request per line; empty disables export
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "fashion-icon-api")
+
+# --- Profiling Setup ---
+# Requests carrying this secret in X-Debug-Profile (or ?profile=) run under the sampling profiler; empty disables it
+PROFILE_SECRET = os.getenv("PROFILE_SECRET", "")
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))
+# Profiles are written here as folded stacks; when empty they replace the response body instead
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "")
 
 # --- Test IDs ---
 FASHION_USER_ID = "profile_user_001" 
 ASSISTANT_AGENT_ID = ["fashion-stylist-gemini"]
 FASHION_GROUP_ID = "fashion-group-01"
 
+# Shared clients, created in the app lifespan
+client: Optional[openai.AsyncOpenAI] = None
+memory_log_writer: Optional["MemoryLogWriter"] = None
+
+def create_openai_client() -> Optional[openai.AsyncOpenAI]:
+    """Builds the async OpenAI client on top of a pooled keep-alive HTTP client."""
+    try:
+        if not api_key:
+            raise ValueError("API Key not found in environment. Please set OPENAI_API_KEY.")
+        return openai.AsyncOpenAI(
+            api_key=api_key,
+            http_client=openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+                ),
+            ),
+        )
+    except Exception as e:
+        print(f"Failed to initialize OpenAI Client: {e}")
+        return None
+
+def create_memmachine_client(base_url: str) -> httpx.AsyncClient:
+    """Builds the pooled HTTP client used for every call to one MemMachine node."""
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers={"Content-Type": "application/json"},
+        limits=httpx.Limits(
+            max_connections=MEMMACHINE_MAX_CONNECTIONS,
+            max_keepalive_connections=MEMMACHINE_MAX_KEEPALIVE,
+            keepalive_expiry=MEMMACHINE_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    """Opens the pooled upstream clients on startup and closes them on shutdown."""
+    global client, memory_log_writer
+    client = create_openai_client()
+    memmachine_ring.open()
+    memory_log_writer = MemoryLogWriter()
+    memory_log_writer.start()
+    try:
+        outfit_catalog.load()
+    except (OSError, ValueError) as e:
+        print(f"Failed to load outfit catalog from {outfit_catalog.path}: {e}")
+    try:
+        yield
+    finally:
+        # Flush pending episodes before the MemMachine pool goes away
+        await memory_log_writer.stop(timeout=MEMORY_LOG_FLUSH_TIMEOUT)
+        await memory_context_cache.close()
+        await alternates_pool.close()
+        await memmachine_ring.aclose()
+        if client is not None:
+            await client.close()
+        span_exporter.close()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Fashion Icon Assistant API",
     description="A backend service that generates outfit recommendations and logs them to MemMachine.",
     version="1.0.0",
+    lifespan=lifespan,
+)
+
+# --- Prometheus Metrics ---
+PHASE_LATENCY = Histogram(
+    "fashion_phase_latency_seconds",
+    "Latency of each phase of the outfit request path.",
+    ["phase"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+OPENAI_TOKENS = Counter(
+    "fashion_openai_tokens_total",
+    "OpenAI tokens used, from response.usage.",
+    ["kind"],
 )
+UPSTREAM_IN_FLIGHT = Gauge(
+    "fashion_upstream_in_flight",
+    "Upstream calls currently in flight.",
+    ["upstream"],
+)
+UPSTREAM_ERRORS = Counter(
+    "fashion_upstream_errors_total",
+    "Failed upstream calls.",
+    ["upstream"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "fashion_requests_in_flight",
+    "HTTP requests currently being handled.",
+    ["path"],
+)
+
+class ServiceStatsCollector:
+    """Exports the in-process component counters reported on /stats."""
+
+    BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def describe(self):
+        # Nothing to pre-register; collect() needs the lifespan-created components
+        return []
+
+    def collect(self):
+        stats = GaugeMetricFamily(
+            "fashion_component_stat",
+            "Counters and sizes of the in-process caches, queues and breaker.",
+            labels=["component", "stat"],
+        )
+        for component, values in component_stats().items():
+            for name, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stats.add_metric([component, name], value)
+        yield stats
+        breaker = GaugeMetricFamily(
+            "fashion_memmachine_breaker_state",
+            "MemMachine circuit breaker state per node (0=closed, 1=half_open, 2=open).",
+            labels=["node"],
+        )
+        for node in memmachine_ring.nodes:
+            breaker.add_metric([node.base_url], self.BREAKER_STATES[node.state])
+        yield breaker
+
+REGISTRY.register(ServiceStatsCollector())
+
+# --- Tracing ---
+class Span:
+    """One timed operation in a trace; propagated to MemMachine as a W3C `traceparent` header."""
+
+    INTERNAL = 1
+    SERVER = 2
+    CLIENT = 3
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+
+    @staticmethod
+    def parse_traceparent(header: Optional[str]) -> Optional[tuple]:
+        """Returns (trace_id, parent span_id) from a `traceparent` header, or None if it is malformed."""
+        parts = (header or "").strip().split("-")
+        if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+            return None
+        return parts[1], parts[2]
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}} for key, value in self.attributes.items()
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+class SpanExporter:
+    """Appends finished spans to a local file in the OTLP/JSON format an OpenTelemetry collector can replay."""
+
+    def __init__(self, path: str = TRACE_EXPORT_PATH, service_name: str = TRACE_SERVICE_NAME):
+        self.path = path
+        self.service_name = service_name
+        self._file = None
+        self.exported = 0
+
+    def export(self, span: Span):
+        if not self.path:
+            return
+        try:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+            self._file.write(json.dumps({"resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "fashion-icon"}, "spans": [span.to_otlp()]}],
+            }]}) + "\n")
+            self.exported += 1
+        except OSError as e:
+            print(f"Error exporting span {span.name} to {self.path}: {e}")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+span_exporter = SpanExporter()
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+@contextmanager
+def trace_span(name: str, kind: int = Span.INTERNAL, traceparent: Optional[str] = None, **attributes):
+    """
+    Times the block as a child of the current span (or of `traceparent`), starting a new trace if there is neither.
+
+    Tasks created inside the block inherit it as their parent through the context.
+    """
+    parent = current_span.get()
+    remote = Span.parse_traceparent(traceparent)
+    if remote is not None:
+        trace_id, parent_id = remote
+    elif parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+    span = Span(name, trace_id, parent_id, kind, attributes)
+    token = current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = repr(e)
+        raise
+    finally:
+        current_span.reset(token)
+        span.end_ns = time.time_ns()
+        span_exporter.export(span)
+
+def current_traceparent() -> Optional[str]:
+    span = current_span.get()
+    return span.traceparent() if span is not None else None
+
+# --- Sampling Profiler ---
+class StackSampler:
+    """
+    Samples one thread's Python stack from a background thread and aggregates the samples as folded stacks.
+
+    The output (one `frame;frame;frame count` line per distinct stack) loads directly into
+    flamegraph.pl or speedscope. Samples show whatever the event loop runs, so work for other
+    concurrent requests can show up too.
+    """
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def __enter__(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.samples.items()))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
 
 # CORS Configuration - Allow all origins for development
 app.add_middleware(
@@ -42,36 +443,1099 @@ class OutfitRequest(BaseModel):
     weather: str
     mood: str
 
+class OutfitBatchRequest(BaseModel):
+    requests: List[OutfitRequest] = Field(..., min_length=1, max_length=OUTFIT_BATCH_MAX_ITEMS)
+
 class MemorySearchRequest(BaseModel):
     session: Dict[str, Any]
     query: str
     limit: Optional[int] = 20
     filter: Optional[Dict[str, Any]] = {}
 
-# Initialize the OpenAI Client
-try:
-    if not api_key:
-        raise ValueError("API Key not found in environment. Please set OPENAI_API_KEY.")
-    client = openai.OpenAI(api_key=api_key)
-except Exception as e:
-    print(f"Failed to initialize OpenAI Client: {e}")
-    client = None
+# --- Background Memory Writer ---
+class MemoryLogWriter:
+    """Bounded in-process queue drained by a background worker that posts episodes to MemMachine."""
+
+    def __init__(
+        self,
+        max_queue: int = MEMORY_LOG_QUEUE_SIZE,
+        batch_size: int = MEMORY_LOG_BATCH_SIZE,
+        concurrency: int = MEMORY_LOG_CONCURRENCY,
+        max_retries: int = MEMORY_LOG_MAX_RETRIES,
+        backoff_seconds: float = MEMORY_LOG_BACKOFF_SECONDS,
+    ):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._worker: Optional[asyncio.Task] = None
+        self._sends: set = set()
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retried = 0
+
+    def start(self):
+        self._worker = asyncio.create_task(self._run())
+
+    def enqueue(self, payload: Dict[str, Any]) -> bool:
+        """Queues an episode without waiting. Returns False if the queue is full and it was dropped."""
+        try:
+            # The episode is sent later by the worker, so carry the caller's trace along with it
+            self.queue.put_nowait((payload, current_traceparent()))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"MemMachine log queue full ({self.queue.maxsize}); dropping episode for {payload.get('producer')}")
+            return False
+        self.enqueued += 1
+        history_cache.invalidate(payload.get("producer"))
+        return True
+
+    def enqueue_many(self, payloads: List[Dict[str, Any]]) -> int:
+        """Queues several episodes back to back so the worker sends them as one batch. Returns how many were queued."""
+        return sum(1 for payload in payloads if self.enqueue(payload))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "retried": self.retried,
+        }
+
+    async def stop(self, timeout: float):
+        """Flushes whatever is queued (up to `timeout` seconds) and stops the worker."""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"MemMachine log flush timed out; {self.queue.qsize()} episodes not sent")
+        tasks = [task for task in (self._worker, *self._sends) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            # Coalesce whatever is already pending into one batch
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            # One request per user, so each lands on that user's MemMachine node
+            by_user: Dict[str, List[tuple]] = {}
+            for payload, traceparent in batch:
+                by_user.setdefault(payload.get("producer"), []).append((payload, traceparent))
+            for user_id, items in by_user.items():
+                # Dispatch without waiting for the send, so a batch stuck in retries only holds
+                # one of the `concurrency` slots instead of stalling the whole queue
+                await self._semaphore.acquire()
+                task = asyncio.create_task(self._send(user_id, items))
+                self._sends.add(task)
+                task.add_done_callback(lambda task, count=len(items): self._send_done(task, count))
+
+    def _send_done(self, task: asyncio.Task, count: int):
+        self._sends.discard(task)
+        self._semaphore.release()
+        for _ in range(count):
+            self.queue.task_done()
+
+    async def _send(self, user_id: str, items: List[tuple]):
+        """Posts one user's episodes to /v1/memories/batch, retrying the ones that failed transiently."""
+        pending = items
+        for attempt in range(self.max_retries + 1):
+            try:
+                with PHASE_LATENCY.labels("memmachine_log").time(), \
+                        trace_span("memmachine_log", traceparent=pending[0][1], user_id=user_id,
+                                   episodes=len(pending), attempt=attempt):
+                    response = await memmachine_ring.request(
+                        user_id, "POST", "/v1/memories/batch",
+                        json={"episodes": [payload for payload, _ in pending]},
+                        timeout=MEMORY_LOG_TIMEOUT_SECONDS,
+                    )
+                response.raise_for_status()
+                results = response.json()["results"]
+            except (httpx.HTTPError, CircuitOpenError, ValueError, KeyError, TypeError) as e:
+                # 4xx responses will not succeed on retry
+                permanent = isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500
+                if permanent or attempt == self.max_retries:
+                    self.failed += len(pending)
+                    print(f"Error logging {len(pending)} episodes to MemMachine for user {user_id}. Error: {e}")
+                    return
+                self.retried += len(pending)
+                # A node shedding load says when to come back; the retry stays on the home node
+                retry_after = retry_after_seconds(e.response) if isinstance(e, httpx.HTTPStatusError) else None
+                await asyncio.sleep(retry_after or self.backoff_seconds * (2 ** attempt))
+                continue
+
+            outcomes = {result.get("index"): result for result in results}
+            sent = 0
+            retry = []
+            for index, item in enumerate(pending):
+                outcome = outcomes.get(index, {"status": -1, "code": 500, "error_msg": "missing from response"})
+                if outcome.get("status") == 0:
+                    sent += 1
+                elif outcome.get("code", 500) >= 500 and attempt < self.max_retries:
+                    retry.append(item)
+                else:
+                    self.failed += 1
+                    print(f"Error logging to MemMachine for user {user_id}. Error: {outcome.get('error_msg')}")
+            if sent:
+                self.sent += sent
+                memory_context_cache.invalidate(user_id)
+                history_cache.invalidate(user_id)
+                print(f"Successfully logged {sent} episodes for user {user_id} to {response.request.url}")
+            if not retry:
+                return
+            self.retried += len(retry)
+            pending = retry
+            await asyncio.sleep(self.backoff_seconds * (2 ** attempt))
+
+def normalize_scenario(req: OutfitRequest) -> str:
+    """Case- and whitespace-insensitive form of the event/weather/mood triple."""
+    return "|".join(" ".join(value.lower().split()) for value in (req.event, req.weather, req.mood))
+
+# --- MemMachine Circuit Breaker ---
+class CircuitOpenError(Exception):
+    """Raised instead of calling MemMachine while the circuit breaker is open."""
+
+class MemMachineGuard:
+    """Circuit breaker, latency tracking and request hedging for one MemMachine node."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        base_url: str,
+        failure_threshold: int = MEMMACHINE_BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = MEMMACHINE_BREAKER_RESET_SECONDS,
+        hedge_enabled: bool = MEMMACHINE_HEDGE_ENABLED,
+        hedge_min_delay: float = MEMMACHINE_HEDGE_MIN_DELAY_SECONDS,
+        latency_window: int = 200,
+    ):
+        self.base_url = base_url
+        self.client: Optional[httpx.AsyncClient] = None
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_delay = hedge_min_delay
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.latencies: deque = deque(maxlen=latency_window)
+        self.opened = 0
+        self.short_circuited = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < 20:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    async def request(self, method: str, url: str, hedge: bool = False, **kwargs) -> httpx.Response:
+        """Sends a MemMachine request through the breaker. Raises CircuitOpenError when short-circuited."""
+        self._before_call()
+        start = time.monotonic()
+        try:
+            with UPSTREAM_IN_FLIGHT.labels("memmachine").track_inprogress(), \
+                    trace_span(f"{method} {url}", kind=Span.CLIENT, node=self.base_url):
+                kwargs["headers"] = {"traceparent": current_traceparent(), **kwargs.get("headers", {})}
+                if hedge and self.hedge_enabled and self.state == self.CLOSED:
+                    response = await self._hedged(method, url, **kwargs)
+                else:
+                    response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self._record_failure()
+            raise
+        except BaseException:
+            self._probe_in_flight = False
+            raise
+        if response.status_code >= 500 and "retry-after" in response.headers:
+            # The node is up but shedding load (e.g. a full ingestion queue), so the breaker stays closed
+            self._record_success(None)
+        elif response.status_code >= 500:
+            self._record_failure()
+        else:
+            # Only hedgeable reads feed the hedge delay; slow writes such as /v1/memories/batch would inflate it
+            self._record_success(time.monotonic() - start if hedge else None)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened": self.opened,
+            "short_circuited": self.short_circuited,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+    def _before_call(self):
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                self.short_circuited += 1
+                raise CircuitOpenError(f"MemMachine circuit breaker for {self.base_url} is open")
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            # Let exactly one probe through; everyone else keeps skipping MemMachine
+            if self._probe_in_flight:
+                self.short_circuited += 1
+                raise CircuitOpenError(f"MemMachine circuit breaker for {self.base_url} is half-open")
+            self._probe_in_flight = True
+
+    def _record_success(self, latency: Optional[float]):
+        if latency is not None:
+            self.latencies.append(latency)
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        self.state = self.CLOSED
+
+    def _record_failure(self):
+        UPSTREAM_ERRORS.labels("memmachine").inc()
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+                print(f"MemMachine circuit breaker for {self.base_url} opened after {self.consecutive_failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    async def _hedged(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Sends a second identical request if the first is slower than the p95, and keeps whichever succeeds first."""
+        delay = max(self.hedge_min_delay, self.p95() or 0.0)
+        first = asyncio.ensure_future(self.client.request(method, url, **kwargs))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        self.hedged += 1
+        second = asyncio.ensure_future(self.client.request(method, url, **kwargs))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code < 500:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+            # Both attempts failed; surface the original request's outcome
+            return first.result()
+        finally:
+            for task in (first, second):
+                if not task.done():
+                    task.cancel()
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+class MemMachineRing:
+    """
+    Routes each user's MemMachine traffic to a node picked by consistent hashing.
+
+    Every node has its own connection pool and breaker. A request fails over to the next node
+    on the ring when its node is short-circuited or unreachable, so a down node's users land
+    where they would if it were removed from MEMMACHINE_NODES. Hedgeable (idempotent) reads
+    also fail over on a 5xx or a dropped connection; writes do not, since the node may have
+    applied them, and are left to the caller's retry on the home node.
+    """
+
+    def __init__(self, base_urls: List[str] = MEMMACHINE_NODES, replicas: int = MEMMACHINE_RING_REPLICAS):
+        self.nodes = [MemMachineGuard(base_url) for base_url in base_urls]
+        points = sorted(
+            (ring_hash(f"{node.base_url}#{replica}"), node)
+            for node in self.nodes
+            for replica in range(replicas)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+        self.failovers = 0
+        self.budget_exceeded = 0
+
+    def open(self):
+        for node in self.nodes:
+            node.client = create_memmachine_client(node.base_url)
+
+    async def aclose(self):
+        await asyncio.gather(*(node.client.aclose() for node in self.nodes if node.client is not None))
+
+    def nodes_for(self, user_id: str) -> List[MemMachineGuard]:
+        """The user's home node followed by its failover order around the ring."""
+        if len(self.nodes) == 1:
+            return self.nodes
+        start = bisect.bisect(self._points, ring_hash(user_id))
+        ordered: List[MemMachineGuard] = []
+        for offset in range(len(self._owners)):
+            node = self._owners[(start + offset) % len(self._owners)]
+            if node not in ordered:
+                ordered.append(node)
+                if len(ordered) == len(self.nodes):
+                    break
+        return ordered
+
+    async def request(self, user_id: str, method: str, url: str, hedge: bool = False, **kwargs) -> httpx.Response:
+        """
+        Sends a request to the user's node, failing over along the ring.
+
+        Returns the last 5xx response if every node answered with one (or the home node's, for
+        a write), and raises the last CircuitOpenError or transport error if none answered at all.
+        """
+        response: Optional[httpx.Response] = None
+        error: Optional[Exception] = None
+        for attempt, node in enumerate(self.nodes_for(user_id)):
+            if attempt:
+                self.failovers += 1
+            try:
+                response = await node.request(method, url, hedge=hedge, **kwargs)
+            except (CircuitOpenError, httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                # The request never reached this node, so any request can safely move on
+                error = e
+                continue
+            except httpx.TransportError as e:
+                if not hedge:
+                    raise
+                error = e
+                continue
+            if response.status_code < 500 or not hedge:
+                return response
+        if response is not None:
+            return response
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "nodes": len(self.nodes),
+            "healthy_nodes": sum(1 for node in self.nodes if node.state == MemMachineGuard.CLOSED),
+            "failovers": self.failovers,
+            "budget_exceeded": self.budget_exceeded,
+        }
+
+memmachine_ring = MemMachineRing()
+
+# --- OpenAI Scheduler ---
+class SchedulerOverloaded(Exception):
+    """Raised when a completion cannot start within its deadline."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"OpenAI queue wait would exceed the deadline (retry in ~{retry_after:.1f}s)")
+        self.retry_after = retry_after
+
+class OpenAIScheduler:
+    """
+    Admits chat completions under requests/min and tokens/min limits with per-user fair queuing.
+
+    Waiting requests are queued per user and admitted round-robin across users, so a burst from
+    one user cannot starve the others. A 429 pauses admission for its Retry-After before retrying,
+    and requests whose estimated wait exceeds their deadline are rejected up front.
+    """
+
+    WINDOW_SECONDS = 60.0
+
+    def __init__(
+        self,
+        rpm_limit: int = OPENAI_RPM_LIMIT,
+        tpm_limit: int = OPENAI_TPM_LIMIT,
+        max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+        max_retries: int = OPENAI_MAX_RETRIES,
+        backoff_seconds: float = OPENAI_RETRY_BACKOFF_SECONDS,
+    ):
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._window: deque = deque()
+        self._window_tokens = 0
+        self._active = 0
+        self._paused_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.admitted = 0
+        self.shed = 0
+        self.rate_limited = 0
+        self.retried = 0
+
+    @staticmethod
+    def estimate_request_tokens(messages: List[Dict[str, str]], max_tokens: int, n: int = 1) -> int:
+        return sum(estimate_tokens(message["content"]) + 4 for message in messages) + max_tokens * n
+
+    async def create_completion(self, user_id: str, deadline: float = OPENAI_REQUEST_DEADLINE_SECONDS, **kwargs) -> Any:
+        """
+        Runs `client.chat.completions.create(**kwargs)` once admitted, retrying 429s and transient errors.
+
+        A `stream=True` call keeps its concurrency slot after returning; the caller must call
+        `release()` once the stream has been consumed or closed.
+        """
+        tokens = self.estimate_request_tokens(kwargs["messages"], kwargs.get("max_tokens") or 0, kwargs.get("n") or 1)
+        deadline_at = time.monotonic() + deadline
+        # The scheduler owns retries so 429s pause everyone instead of each request retrying on its own
+        scheduled_client = client.with_options(max_retries=0)
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(user_id, tokens, deadline_at - time.monotonic())
+            streaming = False
+            try:
+                response = await scheduled_client.chat.completions.create(**kwargs)
+                streaming = bool(kwargs.get("stream"))
+                return response
+            except openai.RateLimitError as e:
+                self.rate_limited += 1
+                delay = retry_after_seconds(e.response) or self.backoff_seconds * (2 ** attempt)
+                self._pause(delay)
+                if attempt == self.max_retries:
+                    raise
+            except (openai.APIConnectionError, openai.InternalServerError):
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_seconds * (2 ** attempt)
+            finally:
+                if not streaming:
+                    self.release()
+            self.retried += 1
+            if time.monotonic() + delay > deadline_at:
+                self.shed += 1
+                raise SchedulerOverloaded(delay)
+            await asyncio.sleep(delay)
+
+    async def acquire(self, user_id: str, tokens: int, deadline: float):
+        """Waits for an admission slot. Raises SchedulerOverloaded if it would take longer than `deadline` seconds."""
+        estimate = self.estimated_wait(tokens)
+        if deadline <= 0 or estimate > deadline:
+            self.shed += 1
+            raise SchedulerOverloaded(estimate)
+
+        ticket = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append((ticket, tokens))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(ticket, timeout=deadline)
+        except asyncio.TimeoutError:
+            self._discard(user_id, ticket)
+            self.shed += 1
+            raise SchedulerOverloaded(self.estimated_wait(tokens))
+        except BaseException:
+            if ticket.done() and not ticket.cancelled():
+                self.release()
+            else:
+                self._discard(user_id, ticket)
+            raise
+
+    def release(self):
+        self._active -= 1
+        self._dispatch()
+
+    def estimated_wait(self, tokens: int) -> float:
+        """Rough seconds until a request queued now would be admitted."""
+        now = time.monotonic()
+        self._expire(now)
+        queued = [entry for queue in self._queues.values() for entry in queue]
+        requests_ahead = len(self._window) + len(queued) + 1 - self.rpm_limit
+        tokens_ahead = self._window_tokens + sum(t for _, t in queued) + tokens - self.tpm_limit
+        wait = max(
+            0.0,
+            requests_ahead / self.rpm_limit * self.WINDOW_SECONDS,
+            tokens_ahead / self.tpm_limit * self.WINDOW_SECONDS,
+        )
+        return max(wait, self._paused_until - now)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": sum(len(queue) for queue in self._queues.values()),
+            "queued_users": len(self._queues),
+            "active": self._active,
+            "window_requests": len(self._window),
+            "window_tokens": self._window_tokens,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "rate_limited": self.rate_limited,
+            "retried": self.retried,
+        }
+
+    def _expire(self, now: float):
+        while self._window and now - self._window[0][0] >= self.WINDOW_SECONDS:
+            _, tokens = self._window.popleft()
+            self._window_tokens -= tokens
+
+    def _pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        print(f"OpenAI rate limited; pausing completions for {seconds:.1f}s")
+
+    def _discard(self, user_id: str, ticket: asyncio.Future):
+        queue = self._queues.get(user_id)
+        if queue is None:
+            return
+        for entry in list(queue):
+            if entry[0] is ticket:
+                queue.remove(entry)
+        if not queue:
+            del self._queues[user_id]
+
+    def _dispatch(self):
+        now = time.monotonic()
+        self._expire(now)
+        wake_at = None
+        while self._queues and self._active < self.max_concurrency:
+            if now < self._paused_until:
+                wake_at = self._paused_until
+                break
+            user_id, queue = next(iter(self._queues.items()))
+            while queue and queue[0][0].done():
+                queue.popleft()
+            if not queue:
+                del self._queues[user_id]
+                continue
+            ticket, tokens = queue[0]
+            over_rpm = len(self._window) >= self.rpm_limit
+            # A request larger than the whole budget is still let through once the window is empty
+            over_tpm = self._window and self._window_tokens + tokens > self.tpm_limit
+            if over_rpm or over_tpm:
+                wake_at = self._window[0][0] + self.WINDOW_SECONDS
+                break
+            queue.popleft()
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            self._window.append((now, tokens))
+            self._window_tokens += tokens
+            self._active += 1
+            self.admitted += 1
+            ticket.set_result(None)
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if wake_at is not None:
+            self._timer = asyncio.get_running_loop().call_later(max(0.0, wake_at - now), self._dispatch)
+
+def retry_after_seconds(response: Optional[httpx.Response]) -> Optional[float]:
+    """Parses OpenAI's retry-after-ms / Retry-After headers."""
+    if response is None:
+        return None
+    try:
+        if "retry-after-ms" in response.headers:
+            return float(response.headers["retry-after-ms"]) / 1000
+        if "retry-after" in response.headers:
+            return float(response.headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+openai_scheduler = OpenAIScheduler()
+
+# --- Outfit Response Cache ---
+class OutfitCache:
+    """LRU + TTL cache of generated outfits keyed on the normalized scenario and memory fingerprint."""
+
+    def __init__(
+        self,
+        max_entries: int = OUTFIT_CACHE_SIZE,
+        ttl_seconds: float = OUTFIT_CACHE_TTL_SECONDS,
+        max_variants: int = OUTFIT_CACHE_VARIANTS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_variants = max(1, max_variants)
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(req: OutfitRequest, memory_context: str) -> str:
+        """Normalizes the scenario and fingerprints the memory context, so a changed profile misses."""
+        scenario = normalize_scenario(req)
+        fingerprint = hashlib.sha256(memory_context.encode("utf-8")).hexdigest()
+        return f"{scenario}|{fingerprint}"
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the next cached variant for the key, or None if nothing is stored."""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry["created"] > self.ttl_seconds:
+            del self._entries[key]
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        outfit = entry["variants"][entry["next"]]
+        entry["next"] = (entry["next"] + 1) % len(entry["variants"])
+        return outfit
+
+    def put(self, key: str, outfit: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = {"created": time.monotonic(), "variants": [], "next": 0}
+            self._entries[key] = entry
+        if len(entry["variants"]) < self.max_variants:
+            entry["variants"].append(outfit)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+outfit_cache = OutfitCache()
+
+# --- Outfit Catalog ---
+class OutfitCatalog:
+    """
+    Offline recommender over a local catalog of looks tagged by event, weather and mood.
+
+    Loading precomputes an inverted index (tag word -> looks, per dimension) and each look's
+    rendered markdown, so a draft is a handful of dict lookups. `load()` swaps the index in
+    whole, so it can be called again to pick up catalog edits without a restart.
+    """
+
+    DIMENSION_WEIGHTS = {"event": 3, "weather": 2, "mood": 1}
+
+    def __init__(self, path: str = OUTFIT_CATALOG_PATH):
+        self.path = path
+        self._looks: List[Dict[str, Any]] = []
+        self._rendered: List[str] = []
+        self._index: Dict[str, Dict[str, List[int]]] = {}
+        self.loaded_at: Optional[float] = None
+        self.reloads = 0
+        self.served = 0
+        self.unmatched = 0
+
+    def load(self) -> int:
+        """(Re)builds the index from the catalog file. Raises and keeps the current index if the file is invalid."""
+        with open(self.path, encoding="utf-8") as f:
+            looks = json.load(f).get("looks", [])
+        index: Dict[str, Dict[str, List[int]]] = {dimension: {} for dimension in self.DIMENSION_WEIGHTS}
+        rendered = []
+        for position, look in enumerate(looks):
+            missing = [key for key in ("vibe", "top", "bottom", "shoes", "accessories", "note") if not look.get(key)]
+            if missing:
+                raise ValueError(f"look {look.get('id', position)} is missing {', '.join(missing)}")
+            for dimension, words in index.items():
+                for word in memory_words(" ".join(look.get(dimension, []))):
+                    words.setdefault(word, []).append(position)
+            rendered.append(self.render(look))
+
+        if self.loaded_at is not None:
+            self.reloads += 1
+        self._looks, self._rendered, self._index = looks, rendered, index
+        self.loaded_at = time.time()
+        print(f"Loaded {len(looks)} catalog looks from {self.path}")
+        return len(looks)
+
+    @staticmethod
+    def render(look: Dict[str, Any]) -> str:
+        """Formats a look with the same three sections the stylist prompt asks the model for."""
+        return (
+            f"### Style Vibe\n{look['vibe']}\n\n"
+            f"### Recommended Outfit\n"
+            f"- **Top:** {look['top']}\n"
+            f"- **Bottom:** {look['bottom']}\n"
+            f"- **Shoes:** {look['shoes']}\n"
+            f"- **Accessories:** {look['accessories']}\n\n"
+            f"### Stylist's Note\n{look['note']}"
+        )
+
+    def suggest(self, req: OutfitRequest) -> Optional[str]:
+        """The best-matching look for the scenario, or None if no catalog is loaded."""
+        rendered, index = self._rendered, self._index
+        if not rendered:
+            return None
+        scores: Dict[int, float] = {}
+        matched = False
+        for dimension, weight in self.DIMENSION_WEIGHTS.items():
+            for word in memory_words(getattr(req, dimension)):
+                for position in index[dimension].get(word, ()):
+                    scores[position] = scores.get(position, 0) + weight
+                    matched = True
+            # Looks tagged "any" fit every value, but less well than an exact tag
+            for position in index[dimension].get("any", ()):
+                scores[position] = scores.get(position, 0) + weight / 2
+
+        # Ties (and scenarios nothing matches) are spread deterministically by scenario
+        scenario_hash = int(hashlib.sha256(normalize_scenario(req).encode("utf-8")).hexdigest(), 16)
+        best = max(scores.values(), default=0)
+        candidates = sorted(position for position, score in scores.items() if score == best) or list(range(len(rendered)))
+        if not matched:
+            self.unmatched += 1
+        self.served += 1
+        return rendered[candidates[scenario_hash % len(candidates)]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "looks": len(self._looks),
+            "reloads": self.reloads,
+            "served": self.served,
+            "unmatched": self.unmatched,
+        }
+
+outfit_catalog = OutfitCatalog()
+
+# --- Alternates Pool ---
+class AlternatesPool:
+    """Per-user, per-scenario pool of spare outfit candidates served by the regenerate endpoint."""
+
+    def __init__(
+        self,
+        ttl_seconds: float = OUTFIT_ALTERNATES_TTL_SECONDS,
+        max_keys: int = OUTFIT_ALTERNATES_MAX_KEYS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        self._pools: "OrderedDict[tuple, deque]" = OrderedDict()
+        self._refilling: Dict[tuple, asyncio.Task] = {}
+        self.served = 0
+        self.empty = 0
+        self.refills = 0
+
+    def put(self, user_id: str, req: OutfitRequest, outfits: List[str]):
+        if not outfits:
+            return
+        key = (user_id, normalize_scenario(req))
+        pool = self._pools.setdefault(key, deque())
+        now = time.monotonic()
+        pool.extend((now, outfit) for outfit in outfits)
+        self._pools.move_to_end(key)
+        while len(self._pools) > self.max_keys:
+            self._pools.popitem(last=False)
+
+    def pop(self, user_id: str, req: OutfitRequest) -> Optional[str]:
+        """Takes the next unexpired alternate for the scenario, if any."""
+        key = (user_id, normalize_scenario(req))
+        pool = self._pools.get(key)
+        now = time.monotonic()
+        while pool:
+            created, outfit = pool.popleft()
+            if now - created < self.ttl_seconds:
+                self.served += 1
+                return outfit
+        self._pools.pop(key, None)
+        self.empty += 1
+        return None
+
+    def remaining(self, user_id: str, req: OutfitRequest) -> int:
+        return len(self._pools.get((user_id, normalize_scenario(req)), ()))
+
+    def refill(self, user_id: str, req: OutfitRequest):
+        """Generates a fresh set of candidates for the scenario in the background (one refill per key at a time)."""
+        key = (user_id, normalize_scenario(req))
+        if key in self._refilling:
+            return
+        self._refilling[key] = asyncio.create_task(self._refill(key, user_id, req))
+
+    async def close(self):
+        tasks = list(self._refilling.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "scenarios": len(self._pools),
+            "alternates": sum(len(pool) for pool in self._pools.values()),
+            "served": self.served,
+            "empty": self.empty,
+            "refills": self.refills,
+        }
+
+    async def _refill(self, key: tuple, user_id: str, req: OutfitRequest):
+        try:
+            memory_context = await retrieve_outfit_context(req)
+            candidates = await generate_candidates(req, memory_context)
+            self.put(user_id, req, candidates)
+            self.refills += 1
+        except Exception as e:
+            print(f"Error refilling outfit alternates: {e}")
+        finally:
+            self._refilling.pop(key, None)
+
+alternates_pool = AlternatesPool()
+
+# --- Memory Context Cache ---
+class MemoryContextCache:
+    """Per-user cache of formatted profile memory context, served stale-while-revalidate."""
+
+    def __init__(
+        self,
+        ttl_seconds: float = MEMORY_CONTEXT_TTL_SECONDS,
+        stale_seconds: float = MEMORY_CONTEXT_STALE_SECONDS,
+        max_queries_per_user: int = MEMORY_CONTEXT_MAX_QUERIES_PER_USER,
+        user_fallback: bool = MEMORY_CONTEXT_USER_FALLBACK,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_queries_per_user = max_queries_per_user
+        self.user_fallback = user_fallback
+        self._users: Dict[str, "OrderedDict[str, Dict[str, Any]]"] = {}
+        # Bumped on every invalidation so an in-flight fetch cannot store pre-write data as fresh
+        self._generations: Dict[str, int] = {}
+        self._refreshing: Dict[tuple, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.user_fallback_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.invalidations = 0
+
+    async def get(self, user_id: str, query: str, fetch: Callable[[], Awaitable[Optional[str]]]) -> str:
+        """Returns the cached context, refreshing in the background when stale and fetching inline on a miss."""
+        entry = self._users.get(user_id, {}).get(query)
+        if entry is not None:
+            age = time.monotonic() - entry["fetched"]
+            if not entry["stale"] and age < self.ttl_seconds:
+                self.hits += 1
+                self._users[user_id].move_to_end(query)
+                return entry["value"]
+            if age < self.ttl_seconds + self.stale_seconds:
+                self.stale_hits += 1
+                self._schedule_refresh(user_id, query, fetch)
+                return entry["value"]
+
+        fallback = self._freshest(user_id) if self.user_fallback and entry is None else None
+        if fallback is not None:
+            self.user_fallback_hits += 1
+            self._schedule_refresh(user_id, query, fetch)
+            return fallback["value"]
+
+        self.misses += 1
+        generation = self._generations.get(user_id, 0)
+        value = await fetch()
+        if value is None:
+            # Upstream failed; fall back to whatever we still hold
+            return entry["value"] if entry is not None else ""
+        self._store(user_id, query, value, generation)
+        return value
+
+    def has_fresh(self, user_id: str) -> bool:
+        return self._freshest(user_id) is not None
+
+    def invalidate(self, user_id: str):
+        """Marks every cached context for the user as stale after a write for that user."""
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        for entry in self._users.get(user_id, {}).values():
+            entry["stale"] = True
+        self.invalidations += 1
+
+    async def close(self):
+        """Cancels background refreshes that are still running."""
+        tasks = list(self._refreshing.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self._users),
+            "entries": sum(len(bucket) for bucket in self._users.values()),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "user_fallback_hits": self.user_fallback_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "invalidations": self.invalidations,
+        }
+
+    def _freshest(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """The user's most recently fetched entry that is neither stale nor past its TTL."""
+        now = time.monotonic()
+        candidates = [
+            entry for entry in self._users.get(user_id, {}).values()
+            if not entry["stale"] and now - entry["fetched"] < self.ttl_seconds
+        ]
+        return max(candidates, key=lambda entry: entry["fetched"]) if candidates else None
+
+    def _store(self, user_id: str, query: str, value: str, generation: int):
+        bucket = self._users.setdefault(user_id, OrderedDict())
+        bucket[query] = {
+            "value": value,
+            "fetched": time.monotonic(),
+            "stale": generation != self._generations.get(user_id, 0),
+        }
+        bucket.move_to_end(query)
+        while len(bucket) > self.max_queries_per_user:
+            bucket.popitem(last=False)
+
+    def _schedule_refresh(self, user_id: str, query: str, fetch: Callable[[], Awaitable[Optional[str]]]):
+        key = (user_id, query)
+        if key in self._refreshing:
+            return
+        self._refreshing[key] = asyncio.create_task(self._refresh(user_id, query, fetch))
+
+    async def _refresh(self, user_id: str, query: str, fetch: Callable[[], Awaitable[Optional[str]]]):
+        try:
+            generation = self._generations.get(user_id, 0)
+            value = await fetch()
+            if value is not None:
+                self.refreshes += 1
+                self._store(user_id, query, value, generation)
+        finally:
+            self._refreshing.pop((user_id, query), None)
+
+memory_context_cache = MemoryContextCache()
+
+# --- Request Coalescing ---
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key share its result."""
+
+    def __init__(self):
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: tuple, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shield so one caller going away does not cancel the work for the others
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._inflight),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+        }
+
+outfit_flights = SingleFlight()
+
+# --- History Cache ---
+class HistoryCache:
+    """Per-user snapshot of the flattened episode history, dropped whenever an episode is logged for the user."""
+
+    def __init__(self, ttl_seconds: float = HISTORY_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._snapshots: Dict[str, Dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        snapshot = self._snapshots.get(user_id)
+        if snapshot is None or time.monotonic() - snapshot["fetched"] > self.ttl_seconds:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return snapshot
+
+    def put(self, user_id: str, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        digest = hashlib.sha256(json.dumps(items, sort_keys=True).encode("utf-8")).hexdigest()
+        snapshot = {"items": items, "digest": digest, "fetched": time.monotonic()}
+        self._snapshots[user_id] = snapshot
+        return snapshot
+
+    def invalidate(self, user_id: Optional[str]):
+        if self._snapshots.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self._snapshots),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+history_cache = HistoryCache()
+history_flights = SingleFlight()
+
+# --- MemMachine Session Registry ---
+class SessionRegistry:
+    """
+    Per-user MemMachine session ids, reused across searches and logs instead of a fresh uuid per call.
+
+    Ids are derived from the rotation window (`<user>-<window>[-<n>]`), so the same session is
+    picked up again after a restart; `-<n>` counts episode-based rotations within a window.
+    """
+
+    def __init__(
+        self,
+        rotation_seconds: int = MEMMACHINE_SESSION_ROTATION_SECONDS,
+        max_episodes: int = MEMMACHINE_SESSION_MAX_EPISODES,
+    ):
+        self.rotation_seconds = max(1, rotation_seconds)
+        self.max_episodes = max_episodes
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self.rotations = 0
+
+    def session_for(self, user_id: str) -> Dict[str, Any]:
+        """The session payload MemMachine expects, for the user's current session."""
+        return {
+            "group_id": FASHION_GROUP_ID,
+            "agent_id": ASSISTANT_AGENT_ID,
+            "user_id": [user_id],
+            "session_id": self._current(user_id)["session_id"],
+        }
+
+    def record_episode(self, user_id: str):
+        """Counts an episode against the current session, rotating once it reaches max_episodes."""
+        current = self._current(user_id)
+        current["episodes"] += 1
+        if self.max_episodes and current["episodes"] >= self.max_episodes:
+            self._start(user_id, current["window"], current["sequence"] + 1)
+
+    def stats(self) -> Dict[str, int]:
+        return {"users": len(self._sessions), "rotations": self.rotations}
+
+    def _current(self, user_id: str) -> Dict[str, Any]:
+        window = int(time.time()) // self.rotation_seconds
+        current = self._sessions.get(user_id)
+        if current is None or current["window"] != window:
+            current = self._start(user_id, window, 0)
+        return current
+
+    def _start(self, user_id: str, window: int, sequence: int) -> Dict[str, Any]:
+        if user_id in self._sessions:
+            self.rotations += 1
+        session_id = f"{user_id}-{window}" + (f"-{sequence}" if sequence else "")
+        self._sessions[user_id] = {
+            "session_id": session_id,
+            "window": window,
+            "sequence": sequence,
+            "episodes": 0,
+        }
+        return self._sessions[user_id]
+
+session_registry = SessionRegistry()
 
 # --- Memory Logging Helper Function ---
-def log_to_memmachine(user_id: str, request_data: OutfitRequest, outfit_response: str):
-    """Logs the user query and AI response to the MemMachine API as a memory episode."""
+def build_memory_episode(user_id: str, request_data: OutfitRequest, outfit_response: str) -> Dict[str, Any]:
+    """Builds the MemMachine episode payload for one outfit interaction."""
     episode_content = (
         f"USER REQUEST (Outfit): Event: {request_data.event}, "
         f"Weather: {request_data.weather}, Mood: {request_data.mood}\n"
         f"AI RESPONSE:\n{outfit_response}"
     )
 
-    session_data = {
-        "group_id": FASHION_GROUP_ID,
-        "agent_id": ASSISTANT_AGENT_ID,
-        "user_id": [user_id],
-        "session_id": str(uuid.uuid4())
-    }
+    session_data = session_registry.session_for(user_id)
+    session_registry.record_episode(user_id)
 
     payload = {
         "session": session_data,
@@ -84,83 +1548,266 @@ def log_to_memmachine(user_id: str, request_data: OutfitRequest, outfit_response
              "api_call": "generate-outfit-endpoint"
         },
     }
-    
-    headers = {"Content-Type": "application/json"}
-    log_url = f"{MEMMACHINE_API_BASE}/v1/memories" 
+    return payload
 
-    try:
-        response = requests.post(log_url, headers=headers, json=payload, timeout=5)
-        response.raise_for_status()
-        print(f"Successfully logged memory for user {user_id} to {log_url}")
-    except requests.exceptions.RequestException as e:
-        print(f"Error logging to MemMachine at {log_url}. Error: {e}")
+def log_to_memmachine(user_id: str, request_data: OutfitRequest, outfit_response: str):
+    """Queues the user query and AI response for the background writer as a memory episode."""
+    memory_log_writer.enqueue(build_memory_episode(user_id, request_data, outfit_response))
+
+# --- Memory Context Builder ---
+MEMORY_CONTEXT_HEADER = (
+    "The user's prior interactions and style preferences (Profile Memory) are below.\n"
+    "USE THIS INFORMATION to tailor your recommendation and refine the **Style Vibe**.\n\n"
+    "--- PROFILE MEMORY CONTEXT ---"
+)
+MEMORY_CONTEXT_FOOTER = "--- END PROFILE MEMORY CONTEXT ---"
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+def memory_relevance(memory: Dict[str, Any]) -> Optional[float]:
+    """The relevance score MemMachine attached to a profile memory, if any."""
+    metadata = memory.get("metadata") if isinstance(memory.get("metadata"), dict) else {}
+    for source, field in (
+        (memory, "score"), (memory, "similarity"), (memory, "relevance"),
+        (metadata, "similarity_score"), (metadata, "score"),
+    ):
+        value = source.get(field)
+        if isinstance(value, (int, float)):
+            return float(value)
+    return None
+
+def memory_words(text: str) -> set:
+    return set(re.sub(r"[^a-z0-9\s]", " ", text.lower()).split())
+
+def build_memory_context(profile_memories: List[Dict[str, Any]], token_budget: int = MEMORY_CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Formats profile memories into the PROFILE MEMORY CONTEXT block.
+
+    Memories are ranked by relevance score (keeping MemMachine's order for ties or missing
+    scores), near-duplicates are dropped, and lines are added while they fit the token budget.
+    A memory too long for the remaining budget is skipped so shorter ones further down still get in.
+    """
+    ranked = sorted(
+        enumerate(profile_memories),
+        key=lambda pair: (-(memory_relevance(pair[1]) or 0.0), pair[0]),
+    )
+
+    lines: List[str] = []
+    kept_words: List[set] = []
+    used = estimate_tokens(MEMORY_CONTEXT_HEADER) + estimate_tokens(MEMORY_CONTEXT_FOOTER)
+    for _, memory in ranked:
+        content = " ".join(str(memory.get("content") or "").split())
+        if not content:
+            continue
+        words = memory_words(content)
+        if any(
+            len(words & seen) / max(1, len(words | seen)) >= MEMORY_CONTEXT_DEDUP_THRESHOLD
+            for seen in kept_words
+        ):
+            continue
+        line = f"- {content}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            continue
+        lines.append(line)
+        kept_words.append(words)
+        used += cost
+
+    if not lines:
+        return ""
+    return "\n".join([MEMORY_CONTEXT_HEADER, *lines, MEMORY_CONTEXT_FOOTER])
 
 # --- Memory Retrieval Helper Function ---
-def retrieve_memories(user_id: str, query: str) -> str:
-    """Retrieves relevant profile memories for the given user and query."""
-    session_data = {
-        "group_id": FASHION_GROUP_ID,
-        "agent_id": ASSISTANT_AGENT_ID,
-        "user_id": [user_id],
-        "session_id": str(uuid.uuid4()) 
-    }
+async def retrieve_memories(user_id: str, query: str) -> str:
+    """
+    Retrieves relevant profile memories for the given user and query, through the per-user cache.
 
+    Returns an empty context once MEMORY_RETRIEVAL_BUDGET_SECONDS is exceeded; the lookup keeps
+    running in the background so its result still lands in the cache.
+    """
+    with PHASE_LATENCY.labels("memory_retrieval").time(), trace_span("memory_retrieval", user_id=user_id):
+        lookup = asyncio.ensure_future(memory_context_cache.get(
+            user_id, query, lambda: fetch_memory_context(user_id, query)
+        ))
+        done, _ = await asyncio.wait({lookup}, timeout=MEMORY_RETRIEVAL_BUDGET_SECONDS)
+    if not done:
+        memmachine_ring.budget_exceeded += 1
+        print(f"Memory retrieval for user {user_id} exceeded its {MEMORY_RETRIEVAL_BUDGET_SECONDS}s budget; continuing without it")
+        return ""
+    return lookup.result()
+
+async def fetch_memory_context(user_id: str, query: str) -> Optional[str]:
+    """Searches MemMachine and formats the profile memory context. Returns None if the search failed."""
     payload = {
-        "session": session_data,
+        "session": session_registry.session_for(user_id),
         "query": query,
-        "limit": 5
+        "limit": MEMORY_SEARCH_LIMIT
     }
 
-    headers = {"Content-Type": "application/json"}
-    search_url = f"{MEMMACHINE_API_BASE}/v1/memories/search"
-
     try:
-        response = requests.post(search_url, headers=headers, json=payload, timeout=5)
+        response = await memmachine_ring.request(
+            user_id, "POST", "/v1/memories/search", hedge=True, json=payload, timeout=MEMMACHINE_SEARCH_TIMEOUT_SECONDS
+        )
         response.raise_for_status()
         
         search_result = response.json()
-        profile_memories = search_result.get("content", {}).get("profile_memory", [])
-        
-        if not profile_memories:
-            return ""
-
-        formatted_memories = "\n".join([
-            f"- Memory ID: {m.get('mem_id', 'N/A')}\n  Content: {m.get('content', 'No content found')}"
-            for m in profile_memories
-        ])
-        
-        return f"""
-The user's prior interactions and style preferences (Profile Memory) are below. 
-USE THIS INFORMATION to tailor your recommendation and refine the **Style Vibe**.
-
---- PROFILE MEMORY CONTEXT ---
-{formatted_memories}
---- END PROFILE MEMORY CONTEXT ---
-"""
-    except requests.exceptions.RequestException as e:
-        print(f"Error retrieving memory from MemMachine at {search_url}. Error: {e}")
-        return ""
+        # A gateway error page is not JSON, and an empty result can carry a null content
+        profile_memories = (search_result.get("content") or {}).get("profile_memory") or []
+        return build_memory_context(profile_memories)
+    except (httpx.HTTPError, CircuitOpenError, ValueError) as e:
+        print(f"Error retrieving memory from MemMachine for user {user_id}. Error: {e}")
+        return None
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "Welcome to the Fashion Icon Assistant API 👗"}
 
+def component_stats() -> Dict[str, Dict[str, Any]]:
+    """Counters for the in-process caches, queues and breaker, keyed by component."""
+    return {
+        "memory_log_writer": memory_log_writer.stats(),
+        "outfit_cache": outfit_cache.stats(),
+        "memory_context_cache": memory_context_cache.stats(),
+        "outfit_flights": outfit_flights.stats(),
+        "history_cache": history_cache.stats(),
+        "memmachine": memmachine_ring.stats(),
+        "sessions": session_registry.stats(),
+        "openai_scheduler": openai_scheduler.stats(),
+        "alternates_pool": alternates_pool.stats(),
+        "outfit_catalog": outfit_catalog.stats(),
+        **{f"memmachine_node[{node.base_url}]": node.stats() for node in memmachine_ring.nodes},
+    }
+
+@app.get("/stats")
+async def stats():
+    """Internal counters for the background services."""
+    return component_stats()
+
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+class RequestsInFlightMiddleware:
+    """ASGI middleware that tracks in-flight HTTP requests per route on REQUESTS_IN_FLIGHT."""
+
+    def __init__(self, application):
+        self.app = application
+        self._route_paths: Optional[set] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self._route_paths is None:
+            # Every route is registered by the time the first request arrives
+            self._route_paths = {route.path for route in scope["app"].routes}
+        # Only label known routes so arbitrary paths cannot blow up metric cardinality
+        path = scope["path"] if scope["path"] in self._route_paths else "other"
+        with REQUESTS_IN_FLIGHT.labels(path).track_inprogress():
+            await self.app(scope, receive, send)
+
+app.add_middleware(RequestsInFlightMiddleware)
+
+class ProfileMiddleware:
+    """
+    ASGI middleware that runs a request under the sampling profiler when it carries PROFILE_SECRET.
+
+    The profile is written to PROFILE_OUTPUT_DIR (named in `X-Profile-Path`) or, without one,
+    returned as the response body. One request is profiled at a time; others get `X-Profile: busy`.
+    With PROFILE_SECRET unset, requests pass straight through.
+    """
+
+    def __init__(self, application):
+        self.app = application
+        self._busy = False
+
+    async def __call__(self, scope, receive, send):
+        if not PROFILE_SECRET or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = dict(scope["headers"]).get(b"x-debug-profile", b"").decode("latin-1")
+        if not token:
+            token = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("profile", [""])[0]
+        if not token or not secrets.compare_digest(token.encode(), PROFILE_SECRET.encode()):
+            await self.app(scope, receive, send)
+            return
+        if self._busy:
+            async def mark_busy(message):
+                if message["type"] == "http.response.start":
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-profile", b"busy")]}
+                await send(message)
+
+            await self.app(scope, receive, mark_busy)
+            return
+
+        self._busy = True
+        messages: List[Dict[str, Any]] = []
+
+        async def buffer(message):
+            messages.append(message)
+
+        try:
+            started = time.perf_counter()
+            # The whole response, including serialization and streaming, is produced under the sampler
+            with StackSampler(threading.get_ident()) as sampler:
+                await self.app(scope, receive, buffer)
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        finally:
+            self._busy = False
+
+        profile = sampler.folded()
+        headers = [
+            (b"x-profile-samples", str(sum(sampler.samples.values())).encode()),
+            (b"x-profile-elapsed-ms", str(elapsed_ms).encode()),
+        ]
+        if not PROFILE_OUTPUT_DIR:
+            body = profile.encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode()),
+                    *headers,
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        name = f"{int(time.time() * 1000)}-{scope['method']}-{re.sub(r'[^A-Za-z0-9]+', '_', scope['path']).strip('_')}.folded"
+        path = os.path.join(PROFILE_OUTPUT_DIR, name)
+        try:
+            os.makedirs(PROFILE_OUTPUT_DIR, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profile)
+            headers.append((b"x-profile-path", path.encode()))
+        except OSError as e:
+            print(f"Error writing profile to {path}: {e}")
+        for message in messages:
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), *headers]}
+            await send(message)
+
+app.add_middleware(ProfileMiddleware)
+
 # --- NEW: Proxy endpoint for memory search with proper CORS ---
 @app.post("/api/memories/search")
-def search_memories_proxy(request: MemorySearchRequest):
+async def search_memories_proxy(request: MemorySearchRequest):
     """
     Proxy endpoint to forward memory search requests to MemMachine.
     This handles CORS properly for frontend requests.
     """
-    headers = {"Content-Type": "application/json"}
-    search_url = f"{MEMMACHINE_API_BASE}/v1/memories/search"
-
+    user_id = (request.session.get("user_id") or [FASHION_USER_ID])[0]
     try:
-        response = requests.post(
-            search_url, 
-            headers=headers, 
+        response = await memmachine_ring.request(
+            user_id,
+            "POST",
+            "/v1/memories/search", 
+            hedge=True,
             json=request.model_dump(), 
-            timeout=10
+            timeout=MEMMACHINE_PROXY_TIMEOUT_SECONDS
         )
         response.raise_for_status()
         result = response.json()
@@ -169,43 +1816,175 @@ def search_memories_proxy(request: MemorySearchRequest):
         print(f"MemMachine search response: {result}")
         
         return result
-    except requests.exceptions.RequestException as e:
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Memory service unavailable: {str(e)}")
+    except (httpx.HTTPError, ValueError) as e:
         print(f"Error proxying search to MemMachine: {e}")
         raise HTTPException(
             status_code=500, 
             detail=f"Failed to search memories: {str(e)}"
         )
 
-@app.post("/generate-outfit")
-def generate_outfit(req: OutfitRequest):
+# --- History Helper Functions ---
+def flatten_episodes(episodic_memory: Any) -> List[Dict[str, Any]]:
+    """Flattens MemMachine's nested episodic_memory arrays into compact, newest-first history items."""
+    items: Dict[str, Dict[str, Any]] = {}
+
+    def visit(node: Any):
+        if isinstance(node, list):
+            for child in node:
+                visit(child)
+        elif isinstance(node, dict) and "content" in node:
+            item_id = str(node.get("uuid") or node.get("mem_id") or len(items))
+            items.setdefault(item_id, {
+                "id": item_id,
+                "content": node.get("content"),
+                "timestamp": node.get("timestamp"),
+            })
+
+    visit(episodic_memory)
+    return sorted(items.values(), key=lambda item: str(item["timestamp"] or ""), reverse=True)
+
+async def fetch_history(user_id: str) -> Dict[str, Any]:
+    """Returns the user's cached history snapshot, searching MemMachine on a miss."""
+    snapshot = history_cache.get(user_id)
+    if snapshot is not None:
+        return snapshot
+
+    async def load() -> Dict[str, Any]:
+        payload = {
+            "session": session_registry.session_for(user_id),
+            "query": HISTORY_QUERY,
+            "limit": HISTORY_FETCH_LIMIT
+        }
+        try:
+            response = await memmachine_ring.request(
+                user_id, "POST", "/v1/memories/search", hedge=True, json=payload, timeout=MEMMACHINE_PROXY_TIMEOUT_SECONDS
+            )
+            response.raise_for_status()
+            episodic_memory = (response.json().get("content") or {}).get("episodic_memory") or []
+        except CircuitOpenError as e:
+            raise HTTPException(status_code=503, detail=f"Memory service unavailable: {str(e)}")
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Error fetching history from MemMachine: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to fetch history: {str(e)}")
+        return history_cache.put(user_id, flatten_episodes(episodic_memory))
+
+    return await history_flights.do(("history", user_id), load)
+
+@app.get("/api/history")
+async def get_history(
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's next_cursor."),
+    limit: int = Query(20, ge=1, le=100),
+    if_none_match: Optional[str] = Header(None),
+):
     """
-    Generate an AI-powered outfit suggestion and log the interaction to MemMachine.
+    Compact, paginated outfit history for the popup.
+
+    Items are flattened server-side to `{id, content, timestamp}`, newest first. Pages are served
+    from a per-user snapshot that is dropped when a new episode is logged, and carry an ETag so an
+    unchanged page costs a 304.
     """
-    if not client:
-        raise HTTPException(
-            status_code=500, 
-            detail="AI client is not initialized. Check server logs for API key errors."
+    try:
+        offset = int(cursor) if cursor else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+    snapshot = await fetch_history(FASHION_USER_ID)
+    etag = 'W/"' + hashlib.sha256(f"{snapshot['digest']}:{offset}:{limit}".encode("utf-8")).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match is not None and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    items = snapshot["items"][offset:offset + limit]
+    next_offset = offset + len(items)
+    response.headers.update(headers)
+    return {
+        "items": items,
+        "next_cursor": str(next_offset) if next_offset < len(snapshot["items"]) else None,
+    }
+
+# --- Warm-up Endpoint ---
+WARMUP_QUERY = "Outfit style preferences, sizes and favourite colours."
+
+@app.post("/warmup")
+async def warmup(
+    history: bool = Query(False, description="Also prefetch the compact history for the profile view."),
+):
+    """
+    Prepares for the user's first outfit request when the popup opens.
+
+    Prefetches and caches the user's memory context (which later requests fall back to while
+    their scenario-specific context loads in the background), opens pooled connections to
+    MemMachine and OpenAI, and optionally loads the compact history. Failures are reported
+    per step and never fail the call.
+    """
+    started = time.perf_counter()
+
+    async def warm_memory() -> bool:
+        if memory_context_cache.has_fresh(FASHION_USER_ID):
+            return True
+        await memory_context_cache.get(
+            FASHION_USER_ID, WARMUP_QUERY, lambda: fetch_memory_context(FASHION_USER_ID, WARMUP_QUERY)
         )
+        return memory_context_cache.has_fresh(FASHION_USER_ID)
+
+    async def warm_openai() -> bool:
+        if client is None:
+            return False
+        # A cheap authenticated GET that leaves a TLS connection in the pool
+        await client.models.retrieve(OUTFIT_MODEL, timeout=5)
+        return True
+
+    async def warm_history() -> bool:
+        await fetch_history(FASHION_USER_ID)
+        return True
 
-    memory_context = retrieve_memories(
+    steps = {"memory_context": warm_memory(), "openai": warm_openai()}
+    if history:
+        steps["history"] = warm_history()
+    outcomes = await asyncio.gather(*steps.values(), return_exceptions=True)
+
+    results = {}
+    for name, outcome in zip(steps, outcomes):
+        if isinstance(outcome, BaseException):
+            print(f"Warm-up step {name} failed: {outcome}")
+            results[name] = False
+        else:
+            results[name] = outcome
+    return {"warmed": results, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+# --- Outfit Prompt Helper Function ---
+STYLIST_INSTRUCTIONS = """You are a world-class, insightful personal fashion stylist. Your goal is to provide a single, 
+personalized outfit recommendation and style summary.
+
+Instructions for Output Structure:
+1. Base your recommendation on the user's input and the provided PROFILE MEMORY CONTEXT (if available).
+2. The entire response must be formatted using **clear markdown headings**.
+3. The output MUST strictly contain only these three sections, in this order:
+   - **Style Vibe (A concise, 1-sentence descriptor of the look).**
+   - **Recommended Outfit (A structured markdown list of Top, Bottom, Shoes, and Accessories).**
+   - **Stylist's Note (A quick, professional tip related to the outfit or user's style).**
+4. DO NOT include any introductory or concluding text outside of these three headings."""
+
+async def retrieve_outfit_context(req: OutfitRequest) -> str:
+    """Retrieves the profile memory context for an outfit request."""
+    return await retrieve_memories(
         user_id=FASHION_USER_ID, 
         query=f"Outfit for {req.event}, {req.weather}, and {req.mood}."
     )
-    
-    system_instruction = f"""
-        {memory_context}
-        You are a world-class, insightful personal fashion stylist. Your goal is to provide a single, 
-        personalized outfit recommendation and style summary.
-        
-        Instructions for Output Structure:
-        1. Base your recommendation on the user's input and the provided PROFILE MEMORY CONTEXT (if available).
-        2. The entire response must be formatted using **clear markdown headings**.
-        3. The output MUST strictly contain only these three sections, in this order:
-           - **Style Vibe (A concise, 1-sentence descriptor of the look).**
-           - **Recommended Outfit (A structured markdown list of Top, Bottom, Shoes, and Accessories).**
-           - **Stylist's Note (A quick, professional tip related to the outfit or user's style).**
-        4. DO NOT include any introductory or concluding text outside of these three headings.
-        """
+
+def build_outfit_messages(req: OutfitRequest, memory_context: str) -> List[Dict[str, str]]:
+    """Builds the chat messages for an outfit request around the user's profile memory context."""
+    start = time.perf_counter()
+    # Static instructions come first so the prompt prefix is identical across requests
+    # and provider-side prompt caching can reuse it; the per-user memory block follows.
+    system_instruction = STYLIST_INSTRUCTIONS
+    if memory_context:
+        system_instruction = f"{STYLIST_INSTRUCTIONS}\n\n{memory_context}"
 
     user_prompt = (
         f"Generate a single, complete outfit for the following scenario: "
@@ -214,25 +1993,361 @@ def generate_outfit(req: OutfitRequest):
         f"Mood/Style: {req.mood}."
     )
 
-    try:
-        response = client.chat.completions.create(
-            model='gpt-4o-mini-2024-07-18',
-            messages=[
-                {"role": "system", "content": system_instruction.strip()},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.8,
-            max_tokens=300
+    messages = [
+        {"role": "system", "content": system_instruction},
+        {"role": "user", "content": user_prompt}
+    ]
+    PHASE_LATENCY.labels("prompt_build").observe(time.perf_counter() - start)
+    return messages
+
+def record_token_usage(usage: Any):
+    """Adds a completion's prompt/completion token counts to the usage counters."""
+    if usage is None:
+        return
+    OPENAI_TOKENS.labels("prompt").inc(usage.prompt_tokens or 0)
+    OPENAI_TOKENS.labels("completion").inc(usage.completion_tokens or 0)
+
+def overloaded_exception(error: SchedulerOverloaded) -> HTTPException:
+    """Fast 503 for a request the OpenAI scheduler shed."""
+    print(f"Shedding outfit request: {error}")
+    return HTTPException(
+        status_code=503,
+        detail="The stylist is busy right now. Please try again shortly.",
+        headers={"Retry-After": str(max(1, round(error.retry_after)))},
+    )
+
+def require_client():
+    """Fails the request early when the OpenAI client could not be created."""
+    if not client:
+        raise HTTPException(
+            status_code=500, 
+            detail="AI client is not initialized. Check server logs for API key errors."
         )
 
-        outfit = response.choices[0].message.content.strip()
-        log_to_memmachine(FASHION_USER_ID, req, outfit) 
-        
-        return {"outfit": outfit}
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Formats one server-sent event frame."""
+    frame = f"event: {event}\n" if event else ""
+    return f"{frame}data: {json.dumps(data)}\n\n"
+
+@app.post("/generate-outfit")
+async def generate_outfit(
+    req: OutfitRequest,
+    response: Response,
+    bypass_cache: bool = Query(False, description="Skip the response cache and force a fresh generation."),
+    traceparent: Optional[str] = Header(None),
+):
+    """
+    Generate an AI-powered outfit suggestion and log the interaction to MemMachine.
+
+    Identical concurrent requests (same user and scenario) share one generation and one logged episode.
+    The request's trace id is returned in `X-Trace-Id` and forwarded to MemMachine.
+    """
+    require_client()
+    with trace_span("generate_outfit", kind=Span.SERVER, traceparent=traceparent, bypass_cache=bypass_cache) as span:
+        response.headers["X-Trace-Id"] = span.trace_id
+        key = (FASHION_USER_ID, normalize_scenario(req), bypass_cache)
+        return await outfit_flights.do(key, lambda: produce_outfit(req, bypass_cache))
+
+async def produce_outfit(req: OutfitRequest, bypass_cache: bool) -> Dict[str, Any]:
+    """Retrieves memory context, generates the outfit and logs the resulting episode."""
+    memory_context = await retrieve_outfit_context(req)
+    result = await outfit_from_context(req, memory_context, bypass_cache)
+    if not result.get("fallback"):
+        log_to_memmachine(FASHION_USER_ID, req, result["outfit"])
+    return result
+
+def lookup_cached_outfit(cache_key: str, bypass_cache: bool) -> Optional[str]:
+    if bypass_cache:
+        outfit_cache.bypassed += 1
+        return None
+    return outfit_cache.get(cache_key)
+
+async def outfit_from_context(req: OutfitRequest, memory_context: str, bypass_cache: bool) -> Dict[str, Any]:
+    """Serves the outfit from the cache or the model for an already retrieved memory context. Does not log."""
+    cache_key = OutfitCache.make_key(req, memory_context)
+    cached = lookup_cached_outfit(cache_key, bypass_cache)
+    if cached is not None:
+        return {"outfit": cached, "cached": True}
 
+    def store(candidates: List[str]):
+        for candidate in candidates:
+            outfit_cache.put(cache_key, candidate)
+        alternates_pool.put(FASHION_USER_ID, req, candidates[1:])
+
+    generation = asyncio.ensure_future(generate_candidates(req, memory_context))
+    try:
+        candidates = await asyncio.wait_for(
+            asyncio.shield(generation),
+            timeout=OUTFIT_FALLBACK_TIMEOUT_SECONDS if OUTFIT_CATALOG_FALLBACK and OUTFIT_FALLBACK_TIMEOUT_SECONDS > 0 else None,
+        )
+        store(candidates)
+        return {"outfit": candidates[0], "cached": False}
+
+    except asyncio.CancelledError:
+        generation.cancel()
+        raise
+    except asyncio.TimeoutError:
+        print(f"Outfit generation exceeded {OUTFIT_FALLBACK_TIMEOUT_SECONDS}s")
+        # Let the slow generation finish so a retry is served from the cache
+        generation.add_done_callback(
+            lambda task: store(task.result()) if not task.cancelled() and task.exception() is None else None
+        )
+        error = HTTPException(status_code=504, detail="Outfit generation timed out.")
+    except SchedulerOverloaded as e:
+        error = overloaded_exception(e)
+    except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+        UPSTREAM_ERRORS.labels("openai").inc()
+        print(f"OpenAI API Error: {e}")
+        error = HTTPException(status_code=500, detail="AI Service Error. Check API key/permissions.")
     except openai.APIError as e:
+        # Not transient (bad key, bad request, malformed reply): a catalog draft would hide it
+        UPSTREAM_ERRORS.labels("openai").inc()
         print(f"OpenAI API Error: {e}")
         raise HTTPException(status_code=500, detail="AI Service Error. Check API key/permissions.")
     except Exception as e:
+        UPSTREAM_ERRORS.labels("openai").inc()
         print(f"Error during AI generation: {e}")
-        raise HTTPException(status_code=500, detail="A general error occurred during outfit generation.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="A general error occurred during outfit generation.")
+
+    fallback = catalog_fallback(req)
+    if fallback is not None:
+        return fallback
+    raise error
+
+def catalog_fallback(req: OutfitRequest) -> Optional[Dict[str, Any]]:
+    """A catalog draft in place of a failed or slow generation. Fallbacks are neither cached nor logged."""
+    if not OUTFIT_CATALOG_FALLBACK:
+        return None
+    draft = outfit_catalog.suggest(req)
+    if draft is None:
+        return None
+    return {"outfit": draft, "cached": False, "fallback": True}
+
+async def generate_candidates(req: OutfitRequest, memory_context: str) -> List[str]:
+    """Asks the model for OUTFIT_CANDIDATES outfits in one completion call."""
+    messages = build_outfit_messages(req, memory_context)
+    with PHASE_LATENCY.labels("openai_completion").time(), \
+            UPSTREAM_IN_FLIGHT.labels("openai").track_inprogress(), \
+            trace_span("openai_completion", kind=Span.CLIENT, model=OUTFIT_MODEL, n=OUTFIT_CANDIDATES):
+        response = await openai_scheduler.create_completion(
+            FASHION_USER_ID,
+            model=OUTFIT_MODEL,
+            messages=messages,
+            temperature=OUTFIT_TEMPERATURE,
+            max_tokens=OUTFIT_MAX_TOKENS,
+            n=OUTFIT_CANDIDATES
+        )
+    record_token_usage(response.usage)
+    candidates = [choice.message.content.strip() for choice in response.choices if choice.message.content]
+    if not candidates:
+        raise ValueError("The model returned no outfit.")
+    return candidates
+
+@app.post("/generate-outfit/draft")
+async def draft_outfit(req: OutfitRequest):
+    """
+    Instant outfit draft from the local catalog, without memory retrieval or the model.
+
+    Meant to be shown while `/generate-outfit` is still running. Drafts are not logged.
+    """
+    draft = outfit_catalog.suggest(req)
+    if draft is None:
+        raise HTTPException(status_code=503, detail="The outfit catalog is not loaded.")
+    return {"outfit": draft, "draft": True}
+
+@app.post("/catalog/reload")
+async def reload_catalog():
+    """Rebuilds the catalog index from OUTFIT_CATALOG_PATH; the current index stays in place if the file is invalid."""
+    try:
+        looks = outfit_catalog.load()
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=500, detail=f"Failed to reload the outfit catalog: {e}")
+    return {"looks": looks}
+
+@app.post("/generate-outfit/regenerate")
+async def regenerate_outfit(req: OutfitRequest):
+    """
+    Serve a different outfit for the same scenario, e.g. after the user disliked the last one.
+
+    Spare candidates from earlier completions are returned instantly and the pool is refilled
+    in the background once it runs dry; only an empty pool waits on a fresh completion, and it
+    starts a refill too so the next regenerate is instant.
+    """
+    require_client()
+    outfit = alternates_pool.pop(FASHION_USER_ID, req)
+    if outfit is not None:
+        if alternates_pool.remaining(FASHION_USER_ID, req) == 0:
+            alternates_pool.refill(FASHION_USER_ID, req)
+        log_to_memmachine(FASHION_USER_ID, req, outfit)
+        return {"outfit": outfit, "cached": False, "alternate": True}
+
+    result = await produce_outfit(req, bypass_cache=True)
+    # With OUTFIT_CANDIDATES=1 the completion leaves no spares behind, so fetch the next one now
+    if alternates_pool.remaining(FASHION_USER_ID, req) == 0:
+        alternates_pool.refill(FASHION_USER_ID, req)
+    return {**result, "alternate": False}
+
+@app.post("/generate-outfit/stream")
+async def generate_outfit_stream(
+    req: OutfitRequest,
+    bypass_cache: bool = Query(False, description="Skip the response cache and force a fresh generation."),
+):
+    """
+    Stream an AI-powered outfit suggestion as server-sent events.
+
+    Each token arrives as a `data: {"delta": ...}` frame. A final `done` event carries the
+    assembled outfit, which is then logged to MemMachine like `/generate-outfit` does.
+    A cache hit is sent as a single delta followed by `done`.
+    """
+    require_client()
+    memory_context = await retrieve_outfit_context(req)
+    cache_key = OutfitCache.make_key(req, memory_context)
+
+    cached = lookup_cached_outfit(cache_key, bypass_cache)
+    if cached is not None:
+        log_to_memmachine(FASHION_USER_ID, req, cached)
+
+        async def cached_stream():
+            yield sse_event({"delta": cached})
+            yield sse_event({"outfit": cached, "cached": True}, event="done")
+
+        return StreamingResponse(
+            cached_stream(),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS,
+        )
+
+    messages = build_outfit_messages(req, memory_context)
+
+    # Open the stream before responding so upstream failures still map to HTTP errors
+    started = time.perf_counter()
+    UPSTREAM_IN_FLIGHT.labels("openai").inc()
+    try:
+        stream = await openai_scheduler.create_completion(
+            FASHION_USER_ID,
+            model=OUTFIT_MODEL,
+            messages=messages,
+            temperature=OUTFIT_TEMPERATURE,
+            max_tokens=OUTFIT_MAX_TOKENS,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+    except SchedulerOverloaded as e:
+        UPSTREAM_IN_FLIGHT.labels("openai").dec()
+        raise overloaded_exception(e)
+    except openai.APIError as e:
+        UPSTREAM_IN_FLIGHT.labels("openai").dec()
+        UPSTREAM_ERRORS.labels("openai").inc()
+        print(f"OpenAI API Error: {e}")
+        raise HTTPException(status_code=500, detail="AI Service Error. Check API key/permissions.")
+
+    released = False
+
+    def release_slot():
+        nonlocal released
+        if not released:
+            released = True
+            openai_scheduler.release()
+
+    async def event_stream():
+        parts = []
+        try:
+            async for chunk in stream:
+                # With include_usage the final chunk has no choices, only usage
+                record_token_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield sse_event({"delta": delta})
+        except Exception as e:
+            UPSTREAM_ERRORS.labels("openai").inc()
+            print(f"Error during AI streaming: {e}")
+            yield sse_event({"detail": "A general error occurred during outfit generation."}, event="error")
+            return
+        finally:
+            # Hands the pooled connection and the scheduler slot back even if the client disconnected mid-stream
+            await stream.close()
+            release_slot()
+            UPSTREAM_IN_FLIGHT.labels("openai").dec()
+            PHASE_LATENCY.labels("openai_completion").observe(time.perf_counter() - started)
+
+        outfit = "".join(parts).strip()
+        if outfit:
+            outfit_cache.put(cache_key, outfit)
+            log_to_memmachine(FASHION_USER_ID, req, outfit)
+        yield sse_event({"outfit": outfit, "cached": False}, event="done")
+
+    body = event_stream()
+    # A client that disconnects before the first chunk leaves the generator unstarted, so its finally never runs
+    weakref.finalize(body, release_slot)
+    return StreamingResponse(
+        body,
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+@app.post("/generate-outfits")
+async def generate_outfits(
+    batch: OutfitBatchRequest,
+    bypass_cache: bool = Query(False, description="Skip the response cache and force fresh generations."),
+    stream: bool = Query(False, description="Send each result as a server-sent event, in request order."),
+):
+    """
+    Generate outfits for several scenarios at once, e.g. a week of events.
+
+    Memory context is retrieved once for the whole batch, completions run concurrently
+    (up to OUTFIT_BATCH_CONCURRENCY) and every episode is logged in one batched write.
+    Results keep the order of `requests`; a failed item carries an `error` instead of an `outfit`.
+    """
+    require_client()
+    scenarios = "; ".join(f"{r.event}, {r.weather}, and {r.mood}" for r in batch.requests)
+    memory_context = await retrieve_memories(
+        user_id=FASHION_USER_ID,
+        query=f"Outfits for: {scenarios}."
+    )
+
+    semaphore = asyncio.Semaphore(OUTFIT_BATCH_CONCURRENCY)
+
+    async def generate_one(req: OutfitRequest) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                return await outfit_from_context(req, memory_context, bypass_cache)
+            except HTTPException as e:
+                return {"error": e.detail}
+
+    tasks = [asyncio.ensure_future(generate_one(req)) for req in batch.requests]
+
+    def log_batch(results: List[Dict[str, Any]]):
+        memory_log_writer.enqueue_many([
+            build_memory_episode(FASHION_USER_ID, req, result["outfit"])
+            for req, result in zip(batch.requests, results)
+            if "outfit" in result and not result.get("fallback")
+        ])
+
+    if not stream:
+        results = await asyncio.gather(*tasks)
+        log_batch(results)
+        return {"results": results}
+
+    async def event_stream():
+        results = []
+        try:
+            for index, task in enumerate(tasks):
+                result = await task
+                results.append(result)
+                yield sse_event({"index": index, **result}, event="item")
+        finally:
+            for task in tasks:
+                task.cancel()
+        log_batch(results)
+        yield sse_event({"count": len(results)}, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
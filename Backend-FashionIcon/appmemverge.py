@@ -12,20 +12,42 @@ It includes:
 """
 
 import asyncio
+import contextvars
+import functools
+import hashlib
+import json
 import logging
+import mmap
 import os
-from contextlib import asynccontextmanager
-from dataclasses import dataclass
+import re
+import secrets
+import struct
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Coroutine, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar, copy_context
+from dataclasses import dataclass, field
 from importlib import import_module
-from typing import Any, cast
+from typing import Any, TypeVar, cast
+from urllib.parse import parse_qs
 
 import uvicorn
 import yaml
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, Response
 from fastmcp import Context, FastMCP
-from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
 from pydantic import BaseModel
 
 from memmachine.common.embedder.openai_embedder import OpenAIEmbedder
@@ -44,6 +66,8 @@ from memmachine.profile_memory.profile_memory import ProfileMemory
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 
 # Request session data
 class SessionData(BaseModel):
@@ -67,6 +91,12 @@ class NewEpisode(BaseModel):
     metadata: dict[str, Any] | None
 
 
+class NewEpisodeBatch(BaseModel):
+    """Request model for adding several memory episodes at once."""
+
+    episodes: list[NewEpisode]
+
+
 class SearchQuery(BaseModel):
     """Request model for searching memories."""
 
@@ -84,6 +114,34 @@ class SearchResult(BaseModel):
     content: dict[str, Any]
 
 
+class BatchItemResult(BaseModel):
+    """Response model for the outcome of one episode in a batch."""
+
+    index: int
+    status: int = 0
+    code: int = 200
+    error_msg: str = ""
+    job_id: str | None = None
+
+
+class ProfileIngestStatus(BaseModel):
+    """Response model for the state of a background profile ingestion job."""
+
+    job_id: str
+    status: str
+    user_id: str
+    enqueued_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    error_msg: str = ""
+
+
+class BatchResult(BaseModel):
+    """Response model for a batch of added episodes, in request order."""
+
+    results: list[BatchItemResult]
+
+
 class MemorySession(BaseModel):
     """Response model for session information."""
 
@@ -111,6 +169,1001 @@ profile_memory: ProfileMemory | None = None
 episodic_memory: EpisodicMemoryManager | None = None
 
 
+# === Embedding Cache ===
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "memmachine_embedding_cache_lookups_total",
+    "Query embedding lookups by outcome (hit, miss, or coalesced onto an "
+    "in-flight miss).",
+    ["outcome"],
+)
+
+
+class EmbeddingCache:
+    """Process-wide LRU of query embeddings keyed by model and text hash.
+
+    Concurrent misses for the same text share one embedding call, so the
+    episodic and profile halves of a combined search embed the query once.
+    """
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], list[float]] = OrderedDict()
+        self._in_flight: dict[tuple[str, str], asyncio.Future] = {}
+
+    @staticmethod
+    def key(model: str, text: str) -> tuple[str, str]:
+        """Returns the cache key for a text embedded with `model`."""
+        return model, hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    async def embed(
+        self,
+        model: str,
+        texts: list[str],
+        compute: Callable[[list[str]], Awaitable[list[list[float]]]],
+    ) -> list[list[float]]:
+        """Returns embeddings for `texts`, computing only the uncached ones.
+
+        Args:
+            model: The embedding model, part of the cache key.
+            texts: The texts to embed.
+            compute: Embeds a list of texts with the underlying embedder.
+
+        Returns:
+            One embedding per text, in order.
+        """
+        keys = [self.key(model, text) for text in texts]
+        found: dict[tuple[str, str], list[float] | asyncio.Future] = {}
+        missing: dict[tuple[str, str], str] = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in missing:
+                continue
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                found[key] = self._entries[key]
+                EMBEDDING_CACHE_LOOKUPS.labels("hit").inc()
+            elif key in self._in_flight:
+                found[key] = self._in_flight[key]
+                EMBEDDING_CACHE_LOOKUPS.labels("coalesced").inc()
+            else:
+                missing[key] = text
+                EMBEDDING_CACHE_LOOKUPS.labels("miss").inc()
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in missing}
+            self._in_flight.update(futures)
+            try:
+                embeddings = await compute(list(missing.values()))
+            except BaseException as e:
+                for future in futures.values():
+                    future.set_exception(e)
+                    # Waiters re-raise it; mark it retrieved for when there are none
+                    future.exception()
+                raise
+            else:
+                for key, embedding in zip(missing, embeddings):
+                    futures[key].set_result(embedding)
+                    found[key] = embedding
+                    self._entries[key] = embedding
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            finally:
+                for key in futures:
+                    self._in_flight.pop(key, None)
+
+        for key, value in found.items():
+            if isinstance(value, asyncio.Future):
+                found[key] = await asyncio.shield(value)
+        return [cast(list[float], found[key]) for key in keys]
+
+
+embedding_cache = EmbeddingCache()
+
+# Directory for the persistent per-model embedding stores. The stores are off
+# when it is unset.
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "")
+
+EMBEDDING_STORE_LOOKUPS = Counter(
+    "memmachine_embedding_store_lookups_total",
+    "Persistent embedding store lookups by outcome (hit or miss).",
+    ["outcome"],
+)
+
+
+class EmbeddingStore:
+    """Append-only, memory-mapped store of float32 embeddings for one model.
+
+    The file is a 16-byte header (magic and dimension count) followed by
+    fixed-width records: the 32-byte sha256 of the text, then the vector as
+    little-endian float32. On open, the records are indexed by digest so a
+    lookup is one dict access and a read straight out of the mapping. New
+    vectors are appended and the mapping is refreshed when a read reaches past
+    it. A torn trailing record from a crash is truncated away on open.
+
+    Only one process should write a given store.
+    """
+
+    HEADER = struct.Struct("<4sI8x")
+    MAGIC = b"EMB1"
+    DIGEST_SIZE = 32
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dims = 0
+        self._offsets: dict[bytes, int] = {}
+        self._size = 0
+        self._fd: int | None = None
+        self._mm: mmap.mmap | None = None
+        self._load()
+
+    @property
+    def record_size(self) -> int:
+        """Returns the size in bytes of one record."""
+        return self.DIGEST_SIZE + 4 * self.dims
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    @staticmethod
+    def digest(text: str) -> bytes:
+        """Returns the record key for `text`."""
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get(self, text: str) -> list[float] | None:
+        """Returns the stored embedding for `text`, or None if there is none."""
+        offset = self._offsets.get(self.digest(text))
+        if offset is None:
+            return None
+        if self._mm is None or offset + 4 * self.dims > len(self._mm):
+            self._remap()
+        return list(struct.unpack_from(f"<{self.dims}f", self._mm, offset))
+
+    def put(self, text: str, embedding: list[float]):
+        """Appends the embedding for `text` unless it is already stored.
+
+        Args:
+            text: The embedded text.
+            embedding: Its embedding. Vectors whose length differs from the
+                store's dimension count are skipped.
+        """
+        key = self.digest(text)
+        if key in self._offsets:
+            return
+        if self._fd is None:
+            self._create(len(embedding))
+        if len(embedding) != self.dims:
+            logger.warning(
+                "Skipping %d-dim embedding for %d-dim store %s",
+                len(embedding),
+                self.dims,
+                self.path,
+            )
+            return
+        os.write(self._fd, key + struct.pack(f"<{self.dims}f", *embedding))
+        self._offsets[key] = self._size + self.DIGEST_SIZE
+        self._size += self.record_size
+
+    def close(self):
+        """Releases the mapping and the file descriptor."""
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            header = f.read(self.HEADER.size)
+        if len(header) < self.HEADER.size:
+            return
+        magic, dims = self.HEADER.unpack(header)
+        if magic != self.MAGIC or dims == 0:
+            raise ValueError(f"{self.path} is not an embedding store")
+        self.dims = dims
+        size = os.path.getsize(self.path)
+        records = (size - self.HEADER.size) // self.record_size
+        self._size = self.HEADER.size + records * self.record_size
+        if self._size != size:
+            os.truncate(self.path, self._size)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND)
+        self._remap()
+        for record in range(records):
+            offset = self.HEADER.size + record * self.record_size
+            key = bytes(self._mm[offset : offset + self.DIGEST_SIZE])
+            self._offsets[key] = offset + self.DIGEST_SIZE
+
+    def _create(self, dims: int):
+        self.dims = dims
+        self._fd = os.open(
+            self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT | os.O_TRUNC, 0o644
+        )
+        os.write(self._fd, self.HEADER.pack(self.MAGIC, dims))
+        self._size = self.HEADER.size
+
+    def _remap(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)
+
+
+embedding_stores: dict[str, EmbeddingStore | None] = {}
+
+
+def embedding_store_for(model: str) -> EmbeddingStore | None:
+    """Returns the persistent store for `model`, opening it on first use.
+
+    Returns None if persistence is disabled or the store cannot be opened.
+    """
+    if not EMBEDDING_STORE_DIR:
+        return None
+    if model not in embedding_stores:
+        name = re.sub(r"[^A-Za-z0-9.-]+", "_", model)
+        path = os.path.join(EMBEDDING_STORE_DIR, f"{name}.f32")
+        try:
+            os.makedirs(EMBEDDING_STORE_DIR, exist_ok=True)
+            store: EmbeddingStore | None = EmbeddingStore(path)
+            logger.info("Opened embedding store %s with %d vectors", path, len(store))
+        except (OSError, ValueError) as e:
+            logger.error("Failed to open embedding store %s: %s", path, e)
+            store = None
+        embedding_stores[model] = store
+    return embedding_stores[model]
+
+
+def close_embedding_stores():
+    """Closes every open embedding store."""
+    for store in embedding_stores.values():
+        if store is not None:
+            store.close()
+    embedding_stores.clear()
+
+
+async def embed_with_store(
+    model: str,
+    texts: list[str],
+    compute: Callable[[list[str]], Awaitable[list[list[float]]]],
+) -> list[list[float]]:
+    """Serves embeddings from the persistent store, computing and storing the rest.
+
+    Args:
+        model: The embedding model, which selects the store.
+        texts: The texts to embed.
+        compute: Embeds a list of texts with the underlying embedder.
+
+    Returns:
+        One embedding per text, in order.
+    """
+    store = embedding_store_for(model)
+    if store is None:
+        return await compute(texts)
+    results = [store.get(text) for text in texts]
+    missing = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+    EMBEDDING_STORE_LOOKUPS.labels("hit").inc(len(texts) - len(missing))
+    if not missing:
+        return cast(list[list[float]], results)
+    EMBEDDING_STORE_LOOKUPS.labels("miss").inc(len(missing))
+    computed = dict(zip(missing, await compute(missing)))
+    for text, embedding in computed.items():
+        store.put(text, embedding)
+    return [r if r is not None else computed[t] for t, r in zip(texts, results)]
+
+
+def embedder_model(embedder: Any) -> str:
+    """Returns the model name an embedder instance uses, for cache keys."""
+    return str(
+        getattr(embedder, "model", None)
+        or getattr(embedder, "_model", None)
+        or type(embedder).__name__
+    )
+
+
+def install_embedding_cache(embedder_class: type):
+    """Routes `embedder_class` embedding calls through the embedding caches.
+
+    `search_embed` goes through the in-process query cache and then the
+    persistent store. `ingest_embed` goes through the persistent store only,
+    so that one-off episode texts do not evict hot queries from the LRU.
+
+    The caches are installed on the class rather than on one instance because
+    the episodic memory manager builds its own embedder from the config file.
+    Patching the class covers that embedder and the profile memory one alike.
+
+    Args:
+        embedder_class: The embedder class to patch.
+    """
+    search = getattr(embedder_class, "search_embed", None)
+    if search is not None and not getattr(search, "_embedding_cache", False):
+
+        @functools.wraps(search)
+        async def search_embed(self, queries, *args, **kwargs):
+            if not all(isinstance(query, str) for query in queries):
+                return await search(self, queries, *args, **kwargs)
+            model = embedder_model(self)
+            return await embedding_cache.embed(
+                model,
+                list(queries),
+                lambda texts: embed_with_store(
+                    model, texts, lambda rest: search(self, rest, *args, **kwargs)
+                ),
+            )
+
+        search_embed._embedding_cache = True  # type: ignore[attr-defined]
+        embedder_class.search_embed = search_embed
+
+    ingest = getattr(embedder_class, "ingest_embed", None)
+    if ingest is not None and not getattr(ingest, "_embedding_cache", False):
+
+        @functools.wraps(ingest)
+        async def ingest_embed(self, inputs, *args, **kwargs):
+            if not all(isinstance(text, str) for text in inputs):
+                return await ingest(self, inputs, *args, **kwargs)
+            model = embedder_model(self)
+            return await embed_with_store(
+                model,
+                list(inputs),
+                lambda rest: ingest(self, rest, *args, **kwargs),
+            )
+
+        ingest_embed._embedding_cache = True  # type: ignore[attr-defined]
+        embedder_class.ingest_embed = ingest_embed
+
+
+install_embedding_cache(OpenAIEmbedder)
+
+
+# === Tracing ===
+# Finished spans are appended to this file as OTLP/JSON lines (one export
+# request per line). Tracing is off when it is unset.
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "memmachine")
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+
+@dataclass
+class Span:
+    """A timed operation within a trace."""
+
+    name: str
+    trace_id: str
+    parent_id: str | None
+    kind: int = SPAN_KIND_INTERNAL
+    span_id: str = field(default_factory=lambda: secrets.token_hex(8))
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int = 0
+    error: str | None = None
+
+    def to_otlp(self) -> dict[str, Any]:
+        """Returns the span in OTLP/JSON form."""
+        span: dict[str, Any] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+_trace_file = None
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str] | None:
+    """Extracts the trace ID and parent span ID from a W3C `traceparent` header.
+
+    Args:
+        header: The header value, e.g. `00-<trace id>-<span id>-01`.
+
+    Returns:
+        A (trace_id, span_id) tuple, or None if the header is missing or malformed.
+    """
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+def export_span(span: Span):
+    """Appends a finished span to TRACE_EXPORT_PATH, if tracing is enabled."""
+    global _trace_file
+    if not TRACE_EXPORT_PATH:
+        return
+    request = {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {
+                            "key": "service.name",
+                            "value": {"stringValue": TRACE_SERVICE_NAME},
+                        }
+                    ]
+                },
+                "scopeSpans": [
+                    {"scope": {"name": "memmachine"}, "spans": [span.to_otlp()]}
+                ],
+            }
+        ]
+    }
+    try:
+        if _trace_file is None:
+            _trace_file = open(TRACE_EXPORT_PATH, "a", encoding="utf-8", buffering=1)
+        _trace_file.write(json.dumps(request) + "\n")
+    except OSError as e:
+        logger.error("Failed to export span %s: %s", span.name, e)
+
+
+@contextmanager
+def trace_span(
+    name: str, kind: int = SPAN_KIND_INTERNAL, traceparent: str | None = None
+) -> Iterator[Span]:
+    """Records the enclosed block as a span.
+
+    The span's parent is the caller's `traceparent` if one is given, otherwise
+    the current span. Without either, the span starts a new trace.
+
+    Args:
+        name: The span name.
+        kind: The OTLP span kind.
+        traceparent: A W3C `traceparent` header received from the caller.
+    """
+    parent = current_span.get()
+    remote = parse_traceparent(traceparent)
+    if remote is not None:
+        trace_id, parent_id = remote
+    elif parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+    span = Span(name=name, trace_id=trace_id, parent_id=parent_id, kind=kind)
+    token = current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = repr(e)
+        raise
+    finally:
+        current_span.reset(token)
+        span.end_ns = time.time_ns()
+        export_span(span)
+
+
+def current_traceparent() -> str | None:
+    """Returns a `traceparent` header for the current span, if there is one."""
+    span = current_span.get()
+    if span is None:
+        return None
+    return f"00-{span.trace_id}-{span.span_id}-01"
+
+
+async def traced(name: str, awaitable: Awaitable[T]) -> T:
+    """Awaits `awaitable` inside a child span of the current span."""
+    with trace_span(name):
+        return await awaitable
+
+
+class TraceMiddleware:
+    """ASGI middleware that records a server span for every /v1 request.
+
+    The span continues the trace from the caller's `traceparent` header, so
+    the memory operations below it line up with the caller's own spans.
+    """
+
+    def __init__(self, application):
+        self.app = application
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/v1/"):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1") or None
+        with trace_span(
+            f"{scope['method']} {scope['path']}",
+            kind=SPAN_KIND_SERVER,
+            traceparent=traceparent,
+        ):
+            await self.app(scope, receive, send)
+
+
+# === Profiling ===
+# Requests carrying this secret in X-Debug-Profile (or ?profile=) run under the
+# sampling profiler. Profiling is off when it is unset.
+PROFILE_SECRET = os.getenv("PROFILE_SECRET", "")
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))
+# Profiles are written here as folded stacks. When it is unset they replace
+# the response body instead.
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "")
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread.
+
+    Samples are aggregated as folded stacks (one `frame;frame;frame count`
+    line per distinct stack), which flamegraph.pl and speedscope load
+    directly. The sampled thread is the event loop, so work for other
+    concurrent requests can show up too.
+    """
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+
+    def __enter__(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self) -> str:
+        """Returns the collected samples in folded-stack format."""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in sorted(self.samples.items())
+        )
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} "
+                    f"({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+
+class ProfileMiddleware:
+    """ASGI middleware that profiles requests carrying PROFILE_SECRET.
+
+    The whole response, including serialization and streaming, is produced
+    under the sampler. The profile is written to PROFILE_OUTPUT_DIR and named
+    in the `x-profile-path` header, or returned as the response body when no
+    directory is configured. One request is profiled at a time.
+    """
+
+    def __init__(self, application):
+        self.app = application
+        self._busy = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILE_SECRET or self._busy:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        token = headers.get(b"x-debug-profile", b"").decode("latin-1")
+        if not token:
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            token = query.get("profile", [""])[0]
+        if not token or not secrets.compare_digest(
+            token.encode(), PROFILE_SECRET.encode()
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        self._busy = True
+        messages: list[dict[str, Any]] = []
+
+        async def buffer(message):
+            messages.append(message)
+
+        try:
+            started = time.perf_counter()
+            with StackSampler(threading.get_ident()) as sampler:
+                await self.app(scope, receive, buffer)
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        finally:
+            self._busy = False
+
+        extra_headers = [
+            (b"x-profile-samples", str(sum(sampler.samples.values())).encode()),
+            (b"x-profile-elapsed-ms", str(elapsed_ms).encode()),
+        ]
+        profile = sampler.folded()
+        if not PROFILE_OUTPUT_DIR:
+            body = profile.encode("utf-8")
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [
+                        (b"content-type", b"text/plain; charset=utf-8"),
+                        (b"content-length", str(len(body)).encode()),
+                        *extra_headers,
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        path_name = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_")
+        path = os.path.join(
+            PROFILE_OUTPUT_DIR,
+            f"{int(time.time() * 1000)}-{scope['method']}-{path_name}.folded",
+        )
+        try:
+            os.makedirs(PROFILE_OUTPUT_DIR, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profile)
+            extra_headers.append((b"x-profile-path", path.encode()))
+        except OSError as e:
+            logger.error("Failed to write profile to %s: %s", path, e)
+        for message in messages:
+            if message["type"] == "http.response.start":
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), *extra_headers],
+                }
+            await send(message)
+
+
+# === Profile Ingestion ===
+# When enabled, profile extraction runs on background workers and the write
+# endpoints return 202 with a job ID. Requests can override it with
+# ?async_profile=.
+PROFILE_INGEST_ASYNC = os.getenv("PROFILE_INGEST_ASYNC", "false").lower() == "true"
+PROFILE_INGEST_WORKERS = int(os.getenv("PROFILE_INGEST_WORKERS", "4"))
+# Writes are rejected with 503 once this many jobs are waiting.
+PROFILE_INGEST_QUEUE_SIZE = int(os.getenv("PROFILE_INGEST_QUEUE_SIZE", "1000"))
+# Finished jobs whose status can still be looked up.
+PROFILE_INGEST_JOB_HISTORY = int(os.getenv("PROFILE_INGEST_JOB_HISTORY", "10000"))
+PROFILE_INGEST_DRAIN_SECONDS = float(os.getenv("PROFILE_INGEST_DRAIN_SECONDS", "30"))
+
+PROFILE_INGEST_LAG = Histogram(
+    "memmachine_profile_ingest_lag_seconds",
+    "Time profile ingestion jobs wait in the queue before a worker starts them.",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+PROFILE_INGEST_DURATION = Histogram(
+    "memmachine_profile_ingest_duration_seconds",
+    "Time spent running add_persona_message for a profile ingestion job.",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+PROFILE_INGEST_JOBS = Counter(
+    "memmachine_profile_ingest_jobs_total",
+    "Profile ingestion jobs by outcome (done, failed or rejected).",
+    ["outcome"],
+)
+
+
+@dataclass
+class ProfileIngestJob:
+    """A queued add_persona_message call."""
+
+    user_id: str
+    message: str
+    metadata: dict[str, Any]
+    isolations: dict[str, Any]
+    traceparent: str | None = None
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"
+    enqueued_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    error_msg: str = ""
+
+    def to_status(self) -> ProfileIngestStatus:
+        """Returns the job's externally visible state."""
+        return ProfileIngestStatus(
+            job_id=self.job_id,
+            status=self.status,
+            user_id=self.user_id,
+            enqueued_at=self.enqueued_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            error_msg=self.error_msg,
+        )
+
+
+class ProfileIngestQueue:
+    """Bounded queue of profile ingestion jobs drained by a pool of workers.
+
+    Callers reserve capacity before writing the episode itself, so a full
+    queue rejects the request before anything is stored and a retry cannot
+    duplicate the episode.
+    """
+
+    def __init__(
+        self,
+        workers: int = PROFILE_INGEST_WORKERS,
+        max_queue: int = PROFILE_INGEST_QUEUE_SIZE,
+        history: int = PROFILE_INGEST_JOB_HISTORY,
+    ):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.history = history
+        self.jobs: OrderedDict[str, ProfileIngestJob] = OrderedDict()
+        self._queue: asyncio.Queue[ProfileIngestJob] | None = None
+        self._reserved = 0
+        self._tasks: list[asyncio.Task] = []
+
+    def depth(self) -> int:
+        """Returns the number of jobs waiting for a worker."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        """Starts the worker pool."""
+        self._queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._work()) for _ in range(self.workers)
+        ]
+
+    async def stop(self, timeout: float):
+        """Lets the workers finish queued jobs for up to `timeout` seconds, then stops them."""
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.error(
+                    "Profile ingestion drain timed out with %d jobs queued",
+                    self._queue.qsize(),
+                )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def reserve(self, count: int = 1) -> bool:
+        """Reserves queue capacity for `count` jobs.
+
+        Returns:
+            True if the capacity was reserved, False if the queue is full.
+        """
+        if self._queue is None or self.depth() + self._reserved + count > self.max_queue:
+            PROFILE_INGEST_JOBS.labels("rejected").inc(count)
+            return False
+        self._reserved += count
+        return True
+
+    def release(self, count: int = 1):
+        """Returns reserved capacity that will not be used."""
+        self._reserved -= count
+
+    def submit(self, job: ProfileIngestJob) -> ProfileIngestJob:
+        """Queues a job in previously reserved capacity."""
+        self._reserved -= 1
+        self.jobs[job.job_id] = job
+        while len(self.jobs) > self.history:
+            self.jobs.popitem(last=False)
+        cast(asyncio.Queue, self._queue).put_nowait(job)
+        return job
+
+    async def _work(self):
+        queue = cast(asyncio.Queue, self._queue)
+        while True:
+            job = await queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            PROFILE_INGEST_LAG.observe(job.started_at - job.enqueued_at)
+            try:
+                with PROFILE_INGEST_DURATION.time(), trace_span(
+                    "add_persona_message", traceparent=job.traceparent
+                ):
+                    await cast(ProfileMemory, profile_memory).add_persona_message(
+                        job.message, job.metadata, job.isolations, user_id=job.user_id
+                    )
+                job.status = "done"
+            except Exception as e:
+                logger.error("Profile ingestion job %s failed: %s", job.job_id, e)
+                job.status = "failed"
+                job.error_msg = str(e)
+            finally:
+                job.finished_at = time.time()
+                PROFILE_INGEST_JOBS.labels(job.status).inc()
+                queue.task_done()
+
+
+profile_ingest_queue = ProfileIngestQueue()
+
+Gauge(
+    "memmachine_profile_ingest_queue_depth",
+    "Profile ingestion jobs waiting for a worker.",
+).set_function(profile_ingest_queue.depth)
+
+
+def profile_ingest_async(async_profile: bool | None) -> bool:
+    """Resolves a request's ?async_profile= override against the configured mode."""
+    return PROFILE_INGEST_ASYNC if async_profile is None else async_profile
+
+
+def queue_full_exception() -> HTTPException:
+    """Returns the 503 sent when the profile ingestion queue has no room."""
+    return HTTPException(
+        status_code=503,
+        detail="profile ingestion queue is full",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def ingest_profile(
+    episode: NewEpisode, isolations: dict[str, Any], queued: bool
+) -> ProfileIngestJob | None:
+    """Passes an episode to profile memory, inline or as a background job.
+
+    Args:
+        episode: The episode to ingest.
+        isolations: The group and session isolation values.
+        queued: Whether to queue the ingestion. Capacity must already be
+            reserved with `profile_ingest_queue.reserve()`.
+
+    Returns:
+        The queued job, or None if the ingestion ran inline.
+    """
+    isolations = {
+        **isolations,
+        "producer": episode.producer,
+        "produced_for": episode.produced_for,
+    }
+    metadata = episode.metadata if episode.metadata is not None else {}
+    if queued:
+        return profile_ingest_queue.submit(
+            ProfileIngestJob(
+                user_id=episode.producer,
+                message=str(episode.episode_content),
+                metadata=metadata,
+                isolations=isolations,
+                traceparent=current_traceparent(),
+            )
+        )
+    await traced(
+        "add_persona_message",
+        cast(ProfileMemory, profile_memory).add_persona_message(
+            str(episode.episode_content),
+            metadata,
+            isolations,
+            user_id=episode.producer,
+        ),
+    )
+    return None
+
+
+def accepted(job_id: str) -> JSONResponse:
+    """Returns the 202 response for a write whose profile ingestion was queued."""
+    return JSONResponse(status_code=202, content={"job_id": job_id, "status": "queued"})
+
+
+# === Write Batching ===
+# Concurrent single-episode writes can be held for up to this long and written
+# together, with one instance lookup and context per session. Each episode is
+# still embedded and stored on its own, so this only pays off when instance
+# lookups are expensive. 0 (the default) writes each episode on its own.
+EPISODE_BATCH_WINDOW_SECONDS = (
+    float(os.getenv("EPISODE_BATCH_WINDOW_MS", "0")) / 1000
+)
+EPISODE_BATCH_MAX_ITEMS = int(os.getenv("EPISODE_BATCH_MAX_ITEMS", "32"))
+
+EPISODE_BATCH_SIZE = Histogram(
+    "memmachine_episode_batch_size",
+    "Episodes written together by one flush of the write batcher.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+
+@dataclass
+class PendingEpisode:
+    """An episode waiting in the write batcher."""
+
+    episode: NewEpisode
+    profile: bool | None
+    future: asyncio.Future
+    # The submitting request's context, so its spans stay in its own trace
+    context: contextvars.Context
+
+
+class EpisodeBatcher:
+    """Groups concurrent single-episode writes into batches.
+
+    The first episode to arrive opens a window; the batch is flushed when
+    the window closes or `max_items` episodes are waiting, whichever comes
+    first. A batch shares one instance lookup and context per session, and
+    its episodes are written concurrently within it. Each caller is answered
+    as soon as its own episode is written and handed to profile memory,
+    without waiting for the rest of the batch.
+    """
+
+    def __init__(
+        self,
+        window: float = EPISODE_BATCH_WINDOW_SECONDS,
+        max_items: int = EPISODE_BATCH_MAX_ITEMS,
+    ):
+        self.window = window
+        self.max_items = max_items
+        self._pending: list[PendingEpisode] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._writes: set[asyncio.Task] = set()
+
+    async def submit(
+        self, episode: NewEpisode, profile: bool | None
+    ) -> BatchItemResult:
+        """Adds an episode to the next batch and waits for it to be written.
+
+        Args:
+            episode: The episode to write.
+            profile: None to skip profile ingestion, otherwise whether to
+                queue it in capacity the caller has already reserved.
+
+        Returns:
+            The episode's result. Its `index` is its position in the batch.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(PendingEpisode(episode, profile, future, copy_context()))
+        if len(self._pending) >= self.max_items:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        """Starts writing the pending episodes as one batch."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        # Run outside any one caller's context; each episode's work runs in its own
+        task = asyncio.create_task(self._write(pending), context=contextvars.Context())
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def drain(self):
+        """Writes anything still pending and waits for in-flight batches."""
+        self.flush()
+        await asyncio.gather(*self._writes, return_exceptions=True)
+
+    async def _write(self, pending: list[PendingEpisode]):
+        EPISODE_BATCH_SIZE.observe(len(pending))
+
+        def resolve(index: int, result: BatchItemResult):
+            # The caller may have gone away; its episode is written regardless
+            if not pending[index].future.done():
+                pending[index].future.set_result(result)
+
+        try:
+            await write_episodes(
+                [item.episode for item in pending],
+                [item.profile for item in pending],
+                contexts=[item.context for item in pending],
+                done=resolve,
+                # Episodes from separate requests have no order to keep
+                ordered=False,
+            )
+        except Exception as e:
+            logger.error("Failed to write a batch of %d episodes: %s", len(pending), e)
+            for index in range(len(pending)):
+                resolve(
+                    index,
+                    BatchItemResult(index=index, status=-1, code=500, error_msg=str(e)),
+                )
+
+
+episode_batcher = EpisodeBatcher()
+
+
 # === Lifespan Management ===
 
 
@@ -179,6 +1232,8 @@ async def http_app_lifespan(application: FastAPI):
     # TODO switch to using builder initialization
     llm_model = OpenAILanguageModel({"api_key": api_key, "model": model})
     embeddings = OpenAIEmbedder({"api_key": api_key})
+    # Map the persistent store now so the first requests after a restart hit it
+    embedding_store_for(embedder_model(embeddings))
 
     global profile_memory
     prompt_file = yaml_config.get("prompt", {}).get("profile", "profile_prompt")
@@ -199,9 +1254,15 @@ async def http_app_lifespan(application: FastAPI):
     global episodic_memory
     episodic_memory = EpisodicMemoryManager.create_episodic_memory_manager(config_file)
     await profile_memory.startup()
+    profile_ingest_queue.start()
     yield
+    await episode_batcher.drain()
+    await profile_ingest_queue.stop(timeout=PROFILE_INGEST_DRAIN_SECONDS)
     await profile_memory.cleanup()
     await episodic_memory.shut_down()
+    close_embedding_stores()
+    if _trace_file is not None:
+        _trace_file.close()
 
 
 mcp = FastMCP("MemMachine")
@@ -226,6 +1287,8 @@ async def mcp_http_lifespan(application: FastAPI):
 
 
 app = FastAPI(lifespan=mcp_http_lifespan)
+app.add_middleware(TraceMiddleware)
+app.add_middleware(ProfileMiddleware)
 app.mount("/mcp", mcp_app)
 
 
@@ -316,6 +1379,26 @@ async def mcp_add_profile_memory(episode: NewEpisode) -> dict[str, Any]:
     return {"status": 0, "error_msg": ""}
 
 
+@mcp.tool()
+async def mcp_add_session_memories(batch: NewEpisodeBatch) -> BatchResult:
+    """MCP tool to add several memory episodes at once. Each episode is added
+    to both episodic and profile memory.
+
+    Episodes may belong to different sessions. The session data is taken from
+    each episode, so no open session is required. Each episode is still
+    written on its own; the batch only shares the per-session setup.
+
+    Args:
+        batch: The episodes to add, each with its session info.
+
+    Returns:
+        A BatchResult with one entry per episode, in order. Status 0 means the
+        episode was added; status -1 carries an HTTP-style code and an error
+        message.
+    """
+    return await add_memories(batch)
+
+
 @mcp.tool()
 async def mcp_search_episodic_memory(q: SearchQuery) -> SearchResult:
     """MCP tool to search for episodic memories in a specific session.
@@ -459,7 +1542,7 @@ async def mcp_get_agent_sessions(agent_id: str) -> AllSessionsResponse:
 
 # === Route Handlers ===
 @app.post("/v1/memories")
-async def add_memory(episode: NewEpisode):
+async def add_memory(episode: NewEpisode, async_profile: bool | None = None):
     """Adds a memory episode to both episodic and profile memory.
 
     This endpoint first retrieves the appropriate episodic memory instance
@@ -467,61 +1550,283 @@ async def add_memory(episode: NewEpisode):
     adds the episode to the episodic memory. If successful, it also passes
     the message to the profile memory for ingestion.
 
+    With EPISODE_BATCH_WINDOW_MS set, concurrent calls share their
+    per-session setup; see `write_episode`.
+
+    In async profile mode the episodic write still completes before the
+    response, but profile ingestion is queued and the endpoint returns 202
+    with a job ID for `GET /v1/memories/jobs/{job_id}`.
+
     Args:
         episode: The NewEpisode object containing the memory details.
+        async_profile: Overrides PROFILE_INGEST_ASYNC for this request.
 
     Raises:
         HTTPException: 404 if no matching episodic memory instance is found.
         HTTPException: 400 if the producer or produced_for IDs are invalid
                        for the given context.
+        HTTPException: 503 if profile ingestion is queued and the queue is
+                       full. Nothing is written in that case.
     """
-    group_id = episode.session.group_id
-    inst: EpisodicMemory | None = await cast(
-        EpisodicMemoryManager, episodic_memory
-    ).get_episodic_memory_instance(
-        group_id=group_id if group_id is not None else "",
-        agent_id=episode.session.agent_id,
-        user_id=episode.session.user_id,
-        session_id=episode.session.session_id,
-    )
-    if inst is None:
-        raise HTTPException(
-            status_code=404,
-            detail=f"""unable to find episodic memory for
-                    {episode.session.user_id},
-                    {episode.session.session_id},
-                    {episode.session.group_id},
-                    {episode.session.agent_id}""",
+    queued = profile_ingest_async(async_profile)
+    if queued and not profile_ingest_queue.reserve():
+        raise queue_full_exception()
+    result = await write_episode(episode, queued)
+    if result.job_id is not None:
+        return accepted(result.job_id)
+
+
+async def write_episode(episode: NewEpisode, profile: bool | None) -> BatchItemResult:
+    """Writes one episode, through the write batcher if it is enabled.
+
+    Args:
+        episode: The episode to write.
+        profile: None to skip profile ingestion, otherwise whether to queue
+            it in capacity the caller has already reserved.
+
+    Raises:
+        HTTPException: The status and message the episode failed with.
+    """
+    if EPISODE_BATCH_WINDOW_SECONDS > 0:
+        result = await episode_batcher.submit(episode, profile)
+    else:
+        [result] = await write_episodes([episode], [profile])
+    if result.status != 0:
+        raise HTTPException(status_code=result.code, detail=result.error_msg)
+    return result
+
+
+@app.post("/v1/memories/batch")
+async def add_memories(
+    batch: NewEpisodeBatch, async_profile: bool | None = None
+) -> BatchResult:
+    """Adds several memory episodes to both episodic and profile memory.
+
+    See `write_episodes` for how the batch is written. A batch saves the
+    per-request round trips and the per-episode instance lookups; it is not
+    a bulk write. Every episode is still embedded and stored by its own
+    `add_memory_episode` call, as MemMachine exposes neither batched
+    embedding nor a multi-episode transaction.
+
+    In async profile mode each successful item carries the job ID of its
+    queued profile ingestion, and the whole batch is rejected with 503 before
+    anything is written if the queue cannot take all of it.
+
+    Args:
+        batch: The NewEpisodeBatch containing the episodes to add.
+        async_profile: Overrides PROFILE_INGEST_ASYNC for this request.
+
+    Returns:
+        A BatchResult with one entry per episode, in request order. A failed
+        episode has status -1, the HTTP status `add_memory` would have
+        returned, and an error message. The other episodes are unaffected.
+    """
+    queued = profile_ingest_async(async_profile)
+    if queued and not profile_ingest_queue.reserve(len(batch.episodes)):
+        raise queue_full_exception()
+    results = await write_episodes(batch.episodes, [queued] * len(batch.episodes))
+    return BatchResult(results=results)
+
+
+async def write_episodes(
+    episodes: list[NewEpisode],
+    profile: list[bool | None],
+    contexts: list[contextvars.Context] | None = None,
+    done: Callable[[int, BatchItemResult], None] | None = None,
+    ordered: bool = True,
+) -> list[BatchItemResult]:
+    """Writes episodes to episodic memory and hands them to profile memory.
+
+    Episodes are grouped by session. Each session's instance is looked up
+    once, and its episodes are written within a single
+    `AsyncEpisodicMemory` context, one `add_memory_episode` call each.
+    Sessions are processed concurrently.
+
+    Args:
+        episodes: The episodes to write.
+        profile: Per episode, None to skip profile ingestion, otherwise
+            whether to queue it. Queue capacity for the queued episodes must
+            already be reserved; capacity for those that fail is released.
+        contexts: Per episode, the context to run its operations in, so
+            their spans join the trace of the request that submitted it.
+        done: Called with each episode's index and final result as soon as
+            that episode is finished, before the rest of the batch.
+        ordered: Whether a session's episodes are written one after another
+            in order. Otherwise they are written concurrently.
+
+    Returns:
+        One result per episode, in order.
+    """
+    results = [BatchItemResult(index=index) for index in range(len(episodes))]
+    sessions: dict[tuple, list[int]] = {}
+    for index, episode in enumerate(episodes):
+        sess = episode.session
+        key = (
+            sess.group_id,
+            tuple(sess.agent_id or []),
+            tuple(sess.user_id or []),
+            sess.session_id,
         )
-    async with AsyncEpisodicMemory(inst) as inst:
-        success = await inst.add_memory_episode(
-            producer=episode.producer,
-            produced_for=episode.produced_for,
-            episode_content=episode.episode_content,
-            episode_type=episode.episode_type,
-            content_type=ContentType.STRING,
-            metadata=episode.metadata,
+        sessions.setdefault(key, []).append(index)
+
+    try:
+        await asyncio.gather(
+            *(
+                add_session_episodes(
+                    episodes, indexes, results, profile, contexts, done, ordered
+                )
+                for indexes in sessions.values()
+            )
+        )
+    finally:
+        # Capacity held for episodes that were cut off before being queued;
+        # failed ones released theirs in add_session_episodes
+        unused = sum(
+            1
+            for result, queued in zip(results, profile)
+            if queued and result.status == 0 and result.job_id is None
+        )
+        if unused:
+            profile_ingest_queue.release(unused)
+    return results
+
+
+async def add_session_episodes(
+    episodes: list[NewEpisode],
+    indexes: list[int],
+    results: list[BatchItemResult],
+    profile: list[bool | None],
+    contexts: list[contextvars.Context] | None = None,
+    done: Callable[[int, BatchItemResult], None] | None = None,
+    ordered: bool = True,
+):
+    """Adds the episodes at `indexes`, which share one session, recording each outcome.
+
+    Each episode's profile ingestion starts as soon as the episode is written
+    and runs alongside the writes after it, so a slow ingestion does not hold
+    up the rest of the session.
+
+    Args:
+        episodes: All episodes of the batch.
+        indexes: Positions in `episodes` of this session's episodes, in order.
+        results: The batch results, updated in place.
+        profile: Per episode, None to skip profile ingestion, otherwise
+            whether to queue it.
+        contexts: Per episode, the context to run its operations in.
+        done: Called with each episode's index and final result.
+        ordered: Whether to write the episodes one after another in order,
+            rather than concurrently.
+    """
+
+    def run(index: int, operation: Awaitable[T]) -> Awaitable[T]:
+        if contexts is None:
+            return operation
+        return asyncio.create_task(
+            cast(Coroutine[Any, Any, T], operation), context=contexts[index].copy()
         )
+
+    def finish(index: int):
+        if done is not None:
+            done(index, results[index])
+
+    def fail(index: int, code: int, error_msg: str):
+        if profile[index] and results[index].job_id is None:
+            # Hand back the queue capacity reserved for this episode right away
+            profile_ingest_queue.release()
+        results[index] = BatchItemResult(
+            index=index, status=-1, code=code, error_msg=error_msg
+        )
+        finish(index)
+
+    async def ingest(index: int):
+        try:
+            job = await ingest_profile(
+                episodes[index], isolations, cast(bool, profile[index])
+            )
+            if job is not None:
+                results[index].job_id = job.job_id
+        except Exception as e:
+            logger.error("Failed to ingest batch episode %d: %s", index, e)
+            fail(index, 500, str(e))
+            return
+        finish(index)
+
+    session = episodes[indexes[0]].session
+    try:
+        inst: EpisodicMemory | None = await run(
+            indexes[0],
+            traced(
+                "get_episodic_memory_instance",
+                cast(
+                    EpisodicMemoryManager, episodic_memory
+                ).get_episodic_memory_instance(
+                    group_id=session.group_id if session.group_id is not None else "",
+                    agent_id=session.agent_id,
+                    user_id=session.user_id,
+                    session_id=session.session_id,
+                ),
+            ),
+        )
+    except Exception as e:
+        logger.error("Failed to open episodic memory for %s: %s", session, e)
+        for index in indexes:
+            fail(index, 500, str(e))
+        return
+    if inst is None:
+        for index in indexes:
+            fail(
+                index,
+                404,
+                f"unable to find episodic memory for {session.user_id}, "
+                f"{session.session_id}, {session.group_id}, {session.agent_id}",
+            )
+        return
+
+    ingestions: list[Awaitable[None]] = []
+
+    async def write(index: int):
+        episode = episodes[index]
+        try:
+            success = await run(
+                index,
+                traced(
+                    "add_memory_episode",
+                    inst.add_memory_episode(
+                        producer=episode.producer,
+                        produced_for=episode.produced_for,
+                        episode_content=episode.episode_content,
+                        episode_type=episode.episode_type,
+                        content_type=ContentType.STRING,
+                        metadata=episode.metadata,
+                    ),
+                ),
+            )
+        except Exception as e:
+            logger.error("Failed to add batch episode %d: %s", index, e)
+            fail(index, 500, str(e))
+            return
         if not success:
-            raise HTTPException(
-                status_code=400,
-                detail=f"""either {episode.producer} or {episode.produced_for}
-                        is not in {episode.session.user_id}
-                        or {episode.session.agent_id}""",
+            fail(
+                index,
+                400,
+                f"either {episode.producer} or {episode.produced_for} "
+                f"is not in {session.user_id} or {session.agent_id}",
             )
+        elif profile[index] is None:
+            finish(index)
+        else:
+            ingestions.append(asyncio.ensure_future(run(index, ingest(index))))
 
+    async with AsyncEpisodicMemory(inst) as inst:
         ctx = inst.get_memory_context()
-        await cast(ProfileMemory, profile_memory).add_persona_message(
-            str(episode.episode_content),
-            episode.metadata if episode.metadata is not None else {},
-            {
-                "group_id": ctx.group_id,
-                "session_id": ctx.session_id,
-                "producer": episode.producer,
-                "produced_for": episode.produced_for,
-            },
-            user_id=episode.producer,
-        )
+        isolations = {"group_id": ctx.group_id, "session_id": ctx.session_id}
+        if ordered:
+            for index in indexes:
+                await write(index)
+        else:
+            await asyncio.gather(*(write(index) for index in indexes))
+
+    await asyncio.gather(*ingestions)
 
 
 @app.post("/v1/memories/episodic")
@@ -533,6 +1838,9 @@ async def add_episodic_memory(episode: NewEpisode):
     adds the episode to the episodic memory. If successful, it also passes
     the message to the profile memory for ingestion.
 
+    With EPISODE_BATCH_WINDOW_MS set, concurrent calls share their
+    per-session setup; see `write_episode`.
+
     Args:
         episode: The NewEpisode object containing the memory details.
 
@@ -541,44 +1849,11 @@ async def add_episodic_memory(episode: NewEpisode):
         HTTPException: 400 if the producer or produced_for IDs are invalid
                        for the given context.
     """
-    group_id = episode.session.group_id
-    inst: EpisodicMemory | None = await cast(
-        EpisodicMemoryManager, episodic_memory
-    ).get_episodic_memory_instance(
-        group_id=group_id if group_id is not None else "",
-        agent_id=episode.session.agent_id,
-        user_id=episode.session.user_id,
-        session_id=episode.session.session_id,
-    )
-    if inst is None:
-        raise HTTPException(
-            status_code=404,
-            detail=f"""unable to find episodic memory for
-                    {episode.session.user_id},
-                    {episode.session.session_id},
-                    {episode.session.group_id},
-                    {episode.session.agent_id}""",
-        )
-    async with AsyncEpisodicMemory(inst) as inst:
-        success = await inst.add_memory_episode(
-            producer=episode.producer,
-            produced_for=episode.produced_for,
-            episode_content=episode.episode_content,
-            episode_type=episode.episode_type,
-            content_type=ContentType.STRING,
-            metadata=episode.metadata,
-        )
-        if not success:
-            raise HTTPException(
-                status_code=400,
-                detail=f"""either {episode.producer} or {episode.produced_for}
-                        is not in {episode.session.user_id}
-                        or {episode.session.agent_id}""",
-            )
+    await write_episode(episode, None)
 
 
 @app.post("/v1/memories/profile")
-async def add_profile_memory(episode: NewEpisode):
+async def add_profile_memory(episode: NewEpisode, async_profile: bool | None = None):
     """Adds a memory episode to both profile memory.
 
     This endpoint first retrieves the appropriate episodic memory instance
@@ -586,27 +1861,51 @@ async def add_profile_memory(episode: NewEpisode):
     adds the episode to the episodic memory. If successful, it also passes
     the message to the profile memory for ingestion.
 
+    In async profile mode the ingestion is queued and the endpoint returns
+    202 with a job ID.
+
     Args:
         episode: The NewEpisode object containing the memory details.
+        async_profile: Overrides PROFILE_INGEST_ASYNC for this request.
 
     Raises:
         HTTPException: 404 if no matching episodic memory instance is found.
         HTTPException: 400 if the producer or produced_for IDs are invalid
                        for the given context.
+        HTTPException: 503 if ingestion is queued and the queue is full.
     """
     group_id = episode.session.group_id
 
-    await cast(ProfileMemory, profile_memory).add_persona_message(
-        str(episode.episode_content),
-        episode.metadata if episode.metadata is not None else {},
+    queued = profile_ingest_async(async_profile)
+    if queued and not profile_ingest_queue.reserve():
+        raise queue_full_exception()
+    job = await ingest_profile(
+        episode,
         {
             "group_id": group_id if group_id is not None else "",
             "session_id": episode.session.session_id,
-            "producer": episode.producer,
-            "produced_for": episode.produced_for,
         },
-        user_id=episode.producer,
+        queued,
     )
+    if job is not None:
+        return accepted(job.job_id)
+
+
+@app.get("/v1/memories/jobs/{job_id}")
+async def get_profile_ingest_job(job_id: str) -> ProfileIngestStatus:
+    """Returns the state of a queued profile ingestion job.
+
+    Args:
+        job_id: The job ID from a 202 response or a batch item.
+
+    Raises:
+        HTTPException: 404 if the job is unknown or has aged out of the
+                       job history.
+    """
+    job = profile_ingest_queue.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"unknown job {job_id}")
+    return job.to_status()
 
 
 @app.post("/v1/memories/search")
@@ -626,13 +1925,14 @@ async def search_memory(q: SearchQuery) -> SearchResult:
     Raises:
         HTTPException: 404 if no matching episodic memory instance is found.
     """
-    inst: EpisodicMemory | None = await cast(
-        EpisodicMemoryManager, episodic_memory
-    ).get_episodic_memory_instance(
-        group_id=q.session.group_id,
-        agent_id=q.session.agent_id,
-        user_id=q.session.user_id,
-        session_id=q.session.session_id,
+    inst: EpisodicMemory | None = await traced(
+        "get_episodic_memory_instance",
+        cast(EpisodicMemoryManager, episodic_memory).get_episodic_memory_instance(
+            group_id=q.session.group_id,
+            agent_id=q.session.agent_id,
+            user_id=q.session.user_id,
+            session_id=q.session.session_id,
+        ),
     )
     if inst is None:
         raise HTTPException(
@@ -651,15 +1951,18 @@ async def search_memory(q: SearchQuery) -> SearchResult:
             else ""
         )
         res = await asyncio.gather(
-            inst.query_memory(q.query, q.limit, q.filter),
-            cast(ProfileMemory, profile_memory).semantic_search(
-                q.query,
-                q.limit if q.limit is not None else 5,
-                isolations={
-                    "group_id": ctx.group_id,
-                    "session_id": ctx.session_id,
-                },
-                user_id=user_id,
+            traced("query_memory", inst.query_memory(q.query, q.limit, q.filter)),
+            traced(
+                "semantic_search",
+                cast(ProfileMemory, profile_memory).semantic_search(
+                    q.query,
+                    q.limit if q.limit is not None else 5,
+                    isolations={
+                        "group_id": ctx.group_id,
+                        "session_id": ctx.session_id,
+                    },
+                    user_id=user_id,
+                ),
             ),
         )
         return SearchResult(
@@ -681,13 +1984,14 @@ async def search_episodic_memory(q: SearchQuery) -> SearchResult:
         HTTPException: 404 if no matching episodic memory instance is found.
     """
     group_id = q.session.group_id if q.session.group_id is not None else ""
-    inst: EpisodicMemory | None = await cast(
-        EpisodicMemoryManager, episodic_memory
-    ).get_episodic_memory_instance(
-        group_id=group_id,
-        agent_id=q.session.agent_id,
-        user_id=q.session.user_id,
-        session_id=q.session.session_id,
+    inst: EpisodicMemory | None = await traced(
+        "get_episodic_memory_instance",
+        cast(EpisodicMemoryManager, episodic_memory).get_episodic_memory_instance(
+            group_id=group_id,
+            agent_id=q.session.agent_id,
+            user_id=q.session.user_id,
+            session_id=q.session.session_id,
+        ),
     )
     if inst is None:
         raise HTTPException(
@@ -699,7 +2003,9 @@ async def search_episodic_memory(q: SearchQuery) -> SearchResult:
                     {q.session.agent_id}""",
         )
     async with AsyncEpisodicMemory(inst) as inst:
-        res = await inst.query_memory(q.query, q.limit, q.filter)
+        res = await traced(
+            "query_memory", inst.query_memory(q.query, q.limit, q.filter)
+        )
         return SearchResult(content={"episodic_memory": res})
 
 
@@ -719,14 +2025,17 @@ async def search_profile_memory(q: SearchQuery) -> SearchResult:
     user_id = q.session.user_id[0] if q.session.user_id is not None else ""
     group_id = q.session.group_id if q.session.group_id is not None else ""
 
-    res = await cast(ProfileMemory, profile_memory).semantic_search(
-        q.query,
-        q.limit if q.limit is not None else 5,
-        isolations={
-            "group_id": group_id,
-            "session_id": q.session.session_id,
-        },
-        user_id=user_id,
+    res = await traced(
+        "semantic_search",
+        cast(ProfileMemory, profile_memory).semantic_search(
+            q.query,
+            q.limit if q.limit is not None else 5,
+            isolations={
+                "group_id": group_id,
+                "session_id": q.session.session_id,
+            },
+            user_id=user_id,
+        ),
     )
     return SearchResult(content={"profile_memory": res})
 
@@ -736,13 +2045,14 @@ async def delete_session_data(delete_req: DeleteDataRequest):
     """
     Delete data for a particular session
     """
-    inst: EpisodicMemory | None = await cast(
-        EpisodicMemoryManager, episodic_memory
-    ).get_episodic_memory_instance(
-        group_id=delete_req.session.group_id,
-        agent_id=delete_req.session.agent_id,
-        user_id=delete_req.session.user_id,
-        session_id=delete_req.session.session_id,
+    inst: EpisodicMemory | None = await traced(
+        "get_episodic_memory_instance",
+        cast(EpisodicMemoryManager, episodic_memory).get_episodic_memory_instance(
+            group_id=delete_req.session.group_id,
+            agent_id=delete_req.session.agent_id,
+            user_id=delete_req.session.user_id,
+            session_id=delete_req.session.session_id,
+        ),
     )
     if inst is None:
         raise HTTPException(
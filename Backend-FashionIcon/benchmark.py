@@ -0,0 +1,357 @@
+"""Load-test and benchmark harness for the Fashion Icon Assistant API (`app.py`).
+
+Runs entirely offline: it starts a fake OpenAI chat-completions server and a fake
+MemMachine server (with injectable latency and error rates), launches `app.py`
+under uvicorn pointed at them, drives the API at a fixed concurrency and writes
+throughput and p50/p95/p99 latency per endpoint as JSON, so runs can be compared
+across commits.
+
+Example:
+    python benchmark.py --concurrency 32 --requests 500 \\
+        --openai-latency 0.4 --memmachine-latency 0.05 --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FAKE_OUTFIT = (
+    "## Style Vibe\nPolished and easy.\n\n"
+    "## Recommended Outfit\n- Top: Cream knit\n- Bottom: Straight-leg trousers\n"
+    "- Shoes: Loafers\n- Accessories: Gold hoops\n\n"
+    "## Stylist's Note\nRoll the sleeves once for a relaxed line."
+)
+
+SCENARIOS = [
+    ("work", "rainy", "confident"),
+    ("brunch", "sunny", "relaxed"),
+    ("wedding", "breezy evening", "romantic"),
+    ("networking dinner", "cold", "bold"),
+    ("birthday", "hot and sunny", "happy"),
+]
+
+
+# === Fake upstreams ===
+class Fault:
+    """Injectable latency (mean +/- jitter, in seconds) and error rate for a fake upstream."""
+
+    def __init__(self, latency: float, jitter: float, error_rate: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    async def apply(self) -> Optional[JSONResponse]:
+        delay = max(0.0, random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+        await asyncio.sleep(delay)
+        if random.random() < self.error_rate:
+            return JSONResponse({"error": "injected failure"}, status_code=500)
+        return None
+
+
+def create_fake_openai(fault: Fault) -> FastAPI:
+    """Minimal OpenAI chat-completions stand-in, streaming and non-streaming."""
+    fake = FastAPI()
+
+    @fake.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        failure = await fault.apply()
+        if failure is not None:
+            return failure
+        n = body.get("n", 1)
+        usage = {"prompt_tokens": 350, "completion_tokens": 120, "total_tokens": 470}
+        if body.get("stream"):
+            async def chunks():
+                for word in FAKE_OUTFIT.split(" "):
+                    chunk = {
+                        "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0,
+                        "model": body.get("model"),
+                        "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                final = {
+                    "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0,
+                    "model": body.get("model"), "choices": [], "usage": usage,
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+        return {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": 0,
+            "model": body.get("model"),
+            "choices": [
+                {"index": i, "message": {"role": "assistant", "content": FAKE_OUTFIT}, "finish_reason": "stop"}
+                for i in range(n)
+            ],
+            "usage": usage,
+        }
+
+    return fake
+
+
+def create_fake_memmachine(fault: Fault) -> FastAPI:
+    """Minimal MemMachine stand-in for the /v1/memories write, batch write and search routes."""
+    fake = FastAPI()
+    episodes: List[Dict[str, Any]] = []
+
+    @fake.post("/v1/memories")
+    async def add_memory(request: Request):
+        episode = await request.json()
+        failure = await fault.apply()
+        if failure is not None:
+            return failure
+        episodes.append(episode)
+        return None
+
+    @fake.post("/v1/memories/batch")
+    async def add_memories(request: Request):
+        batch = await request.json()
+        failure = await fault.apply()
+        if failure is not None:
+            return failure
+        episodes.extend(batch["episodes"])
+        return {"results": [{"index": i, "status": 0, "code": 200, "error_msg": ""} for i in range(len(batch["episodes"]))]}
+
+    @fake.post("/v1/memories/search")
+    async def search_memory(request: Request):
+        await request.json()
+        failure = await fault.apply()
+        if failure is not None:
+            return failure
+        recent = [
+            {"uuid": str(i), "content": e["episode_content"], "timestamp": i}
+            for i, e in enumerate(episodes[-100:])
+        ]
+        profile = [
+            {"mem_id": 1, "content": "Prefers neutral colours and tailored fits."},
+            {"mem_id": 2, "content": "Wears size M tops and 32-inch waist trousers."},
+        ]
+        return {"status": 0, "content": {"episodic_memory": [[], recent, [""]], "profile_memory": profile}}
+
+    return fake
+
+
+# === Harness ===
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def serve_in_background(application: FastAPI, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(application, host="127.0.0.1", port=port, log_level="warning"))
+    server.task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server
+
+
+async def shut_down(*servers: uvicorn.Server):
+    for server in servers:
+        server.should_exit = True
+    await asyncio.gather(*(server.task for server in servers))
+
+
+async def wait_until_up(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as probe:
+        while time.monotonic() < deadline:
+            try:
+                await probe.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def percentile(samples: List[float], pct: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    total = len(latencies) + errors
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(max(latencies)) if latencies else None,
+    }
+
+
+def build_request(endpoint: str, index: int, bypass_cache: bool) -> Dict[str, Any]:
+    event, weather, mood = SCENARIOS[index % len(SCENARIOS)]
+    if endpoint == "generate-outfit":
+        return {
+            "method": "POST",
+            "url": "/generate-outfit",
+            "params": {"bypass_cache": "true"} if bypass_cache else None,
+            "json": {"event": event, "weather": weather, "mood": mood},
+        }
+    if endpoint == "memories-search":
+        return {
+            "method": "POST",
+            "url": "/api/memories/search",
+            "json": {
+                "session": {
+                    "group_id": "fashion-group-01",
+                    "agent_id": ["fashion-stylist-gemini"],
+                    "user_id": ["profile_user_001"],
+                    "session_id": f"bench-{index}",
+                },
+                "query": f"Outfit for {event}, {weather}, and {mood}.",
+                "limit": 5,
+            },
+        }
+    return {"method": "GET", "url": "/"}
+
+
+async def drive(base_url: str, endpoint: str, total: int, concurrency: int, bypass_cache: bool) -> Dict[str, Any]:
+    """Sends `total` requests to one endpoint with `concurrency` workers and summarizes the latencies."""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as http:
+        async def worker():
+            nonlocal errors
+            for index in counter:
+                request = build_request(endpoint, index, bypass_cache)
+                start = time.perf_counter()
+                try:
+                    response = await http.request(**request)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return summarize(latencies, errors, elapsed)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    openai_port, memmachine_port, app_port = free_port(), free_port(), free_port()
+    fake_openai = await serve_in_background(
+        create_fake_openai(Fault(args.openai_latency, args.openai_jitter, args.openai_error_rate)), openai_port
+    )
+    fake_memmachine = await serve_in_background(
+        create_fake_memmachine(Fault(args.memmachine_latency, args.memmachine_jitter, args.memmachine_error_rate)),
+        memmachine_port,
+    )
+
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="benchmark-key",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{openai_port}/v1",
+        MEMMACHINE_API_BASE=f"http://127.0.0.1:{memmachine_port}",
+        # Overrides any MEMMACHINE_NODES from .env or the shell, which would point at real nodes
+        MEMMACHINE_NODES=f"http://127.0.0.1:{memmachine_port}",
+        # Catalog drafts would turn injected OpenAI failures into 200s and hide them from the error rate
+        OUTFIT_CATALOG_FALLBACK="false",
+    )
+    app_process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(app_port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL if args.quiet else None,
+    )
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        await wait_until_up(f"{base_url}/")
+        if args.warmup:
+            await drive(base_url, "root", args.warmup, min(args.concurrency, args.warmup), args.bypass_cache)
+
+        results = {}
+        for endpoint in args.endpoints:
+            results[endpoint] = await drive(base_url, endpoint, args.requests, args.concurrency, args.bypass_cache)
+            print(f"{endpoint}: {json.dumps(results[endpoint])}", file=sys.stderr)
+    finally:
+        app_process.terminate()
+        # Wait off the event loop: the app's shutdown flush still needs the fake MemMachine to answer
+        await asyncio.to_thread(app_process.wait, 30)
+        await shut_down(fake_openai, fake_memmachine)
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "quiet")
+        },
+        "results": results,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--endpoints", nargs="+", default=["root", "memories-search", "generate-outfit"],
+                        choices=["root", "memories-search", "generate-outfit"])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint.")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed requests sent before measuring.")
+    parser.add_argument("--bypass-cache", action="store_true", help="Force a completion on every /generate-outfit.")
+    parser.add_argument("--openai-latency", type=float, default=0.3)
+    parser.add_argument("--openai-jitter", type=float, default=0.05)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--memmachine-latency", type=float, default=0.05)
+    parser.add_argument("--memmachine-jitter", type=float, default=0.01)
+    parser.add_argument("--memmachine-error-rate", type=float, default=0.0)
+    parser.add_argument("--output", default="bench_output.json", help="Where to write the JSON results.")
+    parser.add_argument("--quiet", action="store_true", help="Silence the app's own stdout logging.")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -46,49 +46,22 @@ function App() {
     }
 
     try {
-      const payload = {
-        session: createSessionPayload(),
-        query: "Show all outfit recommendations",
-        limit: 100 // Increased from 20 to 100
-      }
-
-      const response = await fetch(`${API_ROOT}/api/memories/search`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(payload),
-      })
+      // The backend flattens and caches history; the browser revalidates with the ETag
+      const response = await fetch(`${API_ROOT}/api/history?limit=100`)
 
       if (!response.ok) {
         throw new Error(`History fetch failed: ${response.status}`)
       }
 
       const result = await response.json()
-      
-      // DEBUG: Log what we received
-      console.log("Raw MemMachine response:", result)
-      
-      // Parse the nested episodic_memory structure from MemMachine
-      let memories = []
-      
-      if (result.content && result.content.episodic_memory) {
-        // episodic_memory is an array of arrays: [[], [actual_memories], ['']]
-        // We need the second array (index 1)
-        const episodicArrays = result.content.episodic_memory
-        if (Array.isArray(episodicArrays) && episodicArrays.length > 1) {
-          const actualMemories = episodicArrays[1]
-          if (Array.isArray(actualMemories)) {
-            // Transform to match UserProfile's expected format
-            memories = actualMemories.map(mem => ({
-              mem_id: mem.uuid,
-              episode_content: mem.content,
-              timestamp: mem.timestamp,
-              id: mem.uuid
-            }))
-          }
-        }
-      }
-      
-      console.log("Parsed memories:", memories)
+
+      // Transform to match UserProfile's expected format
+      const memories = result.items.map(item => ({
+        mem_id: item.id,
+        episode_content: item.content,
+        timestamp: item.timestamp,
+        id: item.id
+      }))
       
       return { success: true, data: memories }
     } catch (error) {
@@ -1,7 +1,8 @@
-import { useState } from "react"
+import { useEffect, useState } from "react"
 
 // Use localhost instead of 0.0.0.0 for browser compatibility
 const OUTFIT_API_URL = "http://localhost:8000/generate-outfit"
+const WARMUP_API_URL = "http://localhost:8000/warmup"
 
 const parseMarkdownOutput = (markdown) => {
   if (!markdown) return null
@@ -89,6 +90,13 @@ const Popup = ({ onOutfitGenerated }) => {
   const [outfitResult, setOutfitResult] = useState("")
   const [isOutfitLoading, setIsOutfitLoading] = useState(false)
 
+  // Warm the backend's memory cache and upstream connections while the user fills in the form
+  useEffect(() => {
+    fetch(WARMUP_API_URL, { method: "POST" }).catch((error) => {
+      console.warn("Warm-up request failed:", error)
+    })
+  }, [])
+
   const generateOutfitSuggestion = async () => {
     if (isOutfitLoading) return
 